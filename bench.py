@@ -0,0 +1,295 @@
+"""
+Benchmarks for the bits of fetcher.py that have to scale with the Steam
+catalog. Run from the same directory as fetcher.py:
+
+    python3 bench.py applist-memory
+    python3 bench.py frontpage
+    python3 bench.py classify
+    python3 bench.py coldstart
+    python3 bench.py escape
+"""
+import collections
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import click
+
+import fetcher
+
+
+@click.group()
+def bench():
+    pass
+
+
+def write_synthetic_applist(path, size):
+    # written a piece at a time, so generating the 1M app catalog doesn't
+    # skew the numbers for the process doing the measuring.
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"applist": {"apps": [')
+        for appid in range(size):
+            if appid:
+                f.write(', ')
+            name = 'Synthetic Game {}'.format(appid)
+            if appid % 7 == 0:
+                name += ' Soundtrack'
+            f.write(json.dumps({'appid': appid, 'name': name}))
+        f.write(']}}')
+
+
+def parse_streaming(path):
+    kept = 0
+    with open(path, encoding='utf-8') as f:
+        for appid, name in fetcher.iter_apps(f):
+            if not fetcher.USELESS(name):
+                kept += 1
+    return kept
+
+
+def parse_whole(path):
+    with open(path, encoding='utf-8') as f:
+        apps = json.load(f)['applist']['apps']
+    return len([g for g in apps if not fetcher.USELESS(g['name'])])
+
+
+PARSERS = {'streaming': parse_streaming, 'whole': parse_whole}
+
+
+def measure(parser, path, results):
+    start = time.monotonic()
+    kept = PARSERS[parser](path)
+    elapsed = time.monotonic() - start
+    # ru_maxrss is in KiB on Linux.
+    results.put((kept, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+@bench.command('applist-memory')
+@click.option('--sizes', default='100000,250000,500000,1000000', show_default=True,
+              help='Comma separated catalog sizes to try.')
+@click.option('--compare/--no-compare', default=True, show_default=True,
+              help='Also measure the old load-everything parse.')
+def applist_memory(sizes, compare):
+    # every measurement gets a fresh process so the peak RSS belongs to that
+    # parse alone.
+    ctx = multiprocessing.get_context('spawn')
+    parsers = ['streaming', 'whole'] if compare else ['streaming']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in sizes.split(',')]:
+            path = os.path.join(tmp, 'applist-{}.json'.format(size))
+            write_synthetic_applist(path, size)
+
+            for parser in parsers:
+                results = ctx.Queue()
+                p = ctx.Process(target=measure, args=(parser, path, results))
+                p.start()
+                kept, elapsed, rss = results.get()
+                p.join()
+
+                click.echo("{:>9} apps  {:<9}  kept {:>9}  {:6.2f}s  peak RSS {:7.1f} MiB".format(
+                    size, parser, kept, elapsed, rss / 1024))
+
+
+def synthetic_game(appid, lookup_time):
+    return {
+        'appid': appid,
+        'name': 'Synthetic Game {}'.format(appid),
+        'windows': True,
+        'mac': appid % 3 == 0,
+        'linux': appid % 5 == 0,
+        'early_access': appid % 11 == 0,
+        'lookup_time': lookup_time,
+    }
+
+
+@bench.command('frontpage')
+@click.option('--games', default=50000, show_default=True,
+              help='Number of games in the synthetic store.')
+@click.option('--changes', default='0,10,100,1000,10000', show_default=True,
+              help='Comma separated numbers of changed games per build.')
+def frontpage(games, changes):
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(here, 'index.html.template'), tmp)
+        os.chdir(tmp)
+        try:
+            os.mkdir('cache')
+            os.mkdir('templates')
+
+            store = fetcher.game_store = fetcher.GameStore(batch_size=10000)
+            for appid in range(games):
+                store.put(synthetic_game(appid * 10, 0))
+            store.flush()
+
+            # what every run used to do: read everything back and dump it.
+            start = time.monotonic()
+            with open('index.html.template') as f:
+                template = f.read()
+            with open('templates/index.html', 'w') as f:
+                f.write(template.replace('INSERT_GAMES_HERE', json.dumps(store.all())))
+            click.echo("{:>7} games  full rebuild            {:8.1f}ms".format(
+                games, (time.monotonic() - start) * 1000))
+
+            page = fetcher.FrontPage()
+            page.build(set(), set())
+
+            for n in [int(c) for c in changes.split(',')]:
+                store.changed = set()
+                for appid in random.sample(range(games), n):
+                    store.put(synthetic_game(appid * 10, int(time.time())))
+                store.flush()
+
+                start = time.monotonic()
+                page.build(store.changed, set())
+                click.echo("{:>7} games  incremental, {:>6} changed {:8.1f}ms".format(
+                    games, n, (time.monotonic() - start) * 1000))
+        finally:
+            os.chdir(here)
+
+
+def load_corpus(path):
+    # either a json dump (a GetNewsForApp response, a list of news items, or
+    # a list of bodies) or, by default, everything in the news archive.
+    if path is None:
+        db = sqlite3.connect(fetcher.game_store.path)
+        return [contents for contents, in db.execute('SELECT contents FROM news')]
+
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if isinstance(corpus, dict):
+        corpus = corpus['appnews']['newsitems']
+    return [item['contents'] if isinstance(item, dict) else item for item in corpus]
+
+
+def old_is_bbcode(tags, value):
+    # render_article's check from before ArticleClassifier.
+    for k in tags:
+        k = '[%s' % k
+        if k in value.lower():
+            return True
+    return False
+
+
+@bench.command('classify')
+@click.option('--corpus', default=None, type=click.Path(exists=True),
+              help='JSON file of Steam article bodies (defaults to the news archive).')
+@click.option('--repeat', default=5, show_default=True)
+def classify(corpus, repeat):
+    bodies = load_corpus(corpus)
+    if not bodies:
+        raise click.ClickException("no articles to classify, run an update first or pass --corpus")
+
+    renderer = fetcher.AtomRenderer()
+    tags = list(renderer.bbcode_parser.recognized_tags)
+    classifier = renderer.classify
+
+    kinds = collections.Counter(classifier(body) for body in bodies)
+    click.echo("{} articles, {:.1f} KiB on average: {}".format(
+        len(bodies), sum(map(len, bodies)) / len(bodies) / 1024,
+        ', '.join('{} {}'.format(n, kind) for kind, n in kinds.most_common())))
+
+    def timed(f):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for body in bodies:
+                f(body)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    old = timed(lambda body: old_is_bbcode(tags, body))
+    new = timed(classifier)
+    click.echo("per-tag substring scan  {:8.2f}ms".format(old * 1000))
+    click.echo("single-pass classifier  {:8.2f}ms  ({:.1f}x)".format(new * 1000, old / new))
+
+
+SAMPLE_GAME = {
+    'appid': 10,
+    'name': 'Counter-Strike',
+    'updated': 1490962305,
+    'newsitems': [{
+        'gid': str(i),
+        'title': 'Release notes {}'.format(i),
+        'url': 'http://store.steampowered.com/news/{}'.format(i),
+        'author': 'bench',
+        'contents': '[b]Fixes[/b]\n' + 'fixed a crash\n' * 50,
+        'date': 1490962305 - i * 3600,
+    } for i in range(10)],
+}
+
+
+def cold_render(template, bytecode_cache, results):
+    start = time.perf_counter()
+    renderer = fetcher.AtomRenderer(template=template, bytecode_cache=bytecode_cache)
+    renderer(SAMPLE_GAME)
+    results.put(time.perf_counter() - start)
+
+
+@bench.command('coldstart')
+@click.option('--runs', default=5, show_default=True)
+def coldstart(runs):
+    # a fresh process per run, like every update and every serve worker.
+    ctx = multiprocessing.get_context('spawn')
+    template = os.path.abspath('atomfeed.xml')
+
+    def run(bytecode_cache):
+        times = []
+        for _ in range(runs):
+            results = ctx.Queue()
+            p = ctx.Process(target=cold_render, args=(template, bytecode_cache, results))
+            p.start()
+            times.append(results.get())
+            p.join()
+        return sorted(times)[len(times) // 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uncached = run(None)
+        run(tmp)  # warm it
+        cached = run(tmp)
+
+    click.echo("renderer + first feed, compiling        {:7.2f}ms".format(uncached * 1000))
+    click.echo("renderer + first feed, bytecode cached  {:7.2f}ms".format(cached * 1000))
+
+
+def replace_escape(s):
+    # what cgi.escape did.
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+@bench.command('escape')
+@click.option('--size', default=64, show_default=True,
+              help='Article body size in KiB.')
+@click.option('--articles', default=200, show_default=True)
+def escape(size, articles):
+    import html
+    import markupsafe
+
+    # a typical steam body: html-ish markup with a fair few characters
+    # that need escaping.
+    chunk = '<p>Fixed a crash when "Q&A" <b>mode</b> was on & off.</p>\n'
+    body = chunk * (size * 1024 // len(chunk))
+    bodies = [body + str(i) for i in range(articles)]
+
+    escapers = [
+        ('str.replace (old cgi.escape)', replace_escape),
+        ('html.escape', html.escape),
+        ('markupsafe.escape', markupsafe.escape),
+    ]
+    click.echo("{} articles of {} KiB".format(articles, size))
+    for name, f in escapers:
+        start = time.perf_counter()
+        for b in bodies:
+            f(b)
+        click.echo("{:<30} {:8.2f}ms".format(name, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,167 @@
+"""
+A tiny stand-in for the bits of the Steam Web API that fetcher.py talks to,
+so crawls can be run and timed without going anywhere near Valve.
+
+    python3 fakesteam.py --apps 50000 --latency 0.05 &
+    STEAMNEWS_API_BASE=http://127.0.0.1:8099 \\
+    STEAMNEWS_STORE_BASE=http://127.0.0.1:8099 \\
+        python3 fetcher.py update --concurrency 32
+
+Apart from click, which fetcher.py needs anyway, only the standard library
+is used.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import click
+
+
+ONE_HOUR = 60 * 60
+RATE_WINDOW = 10
+
+
+class FakeSteam:
+    def __init__(self, apps, latency, seed, rate=0):
+        self.apps = apps
+        self.latency = latency
+        self.seed = seed
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.served = 0
+        self.throttled = 0
+        self.started = time.monotonic()
+
+        # same sort of fixed window the store appears to use.
+        self.window_start = self.started
+        self.window_count = 0
+
+    def over_quota(self):
+        if not self.rate:
+            return None
+
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= RATE_WINDOW:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            if self.window_count <= self.rate * RATE_WINDOW:
+                return None
+            self.throttled += 1
+            return int(self.window_start + RATE_WINDOW - now) + 1
+
+    def app_list(self):
+        apps = [{'appid': appid, 'name': 'Fake Game {}'.format(appid)}
+                for appid in range(10, (self.apps + 1) * 10, 10)]
+        return {'applist': {'apps': apps}}
+
+    def app_details(self, appid):
+        rand = random.Random(self.seed ^ appid)
+
+        # roughly what the real store gives back: mostly games, some region
+        # blocked apps and a sprinkling of DLC/videos.
+        roll = rand.random()
+        if roll < 0.05:
+            return {str(appid): {'success': False}}
+
+        data = {
+            'type': 'dlc' if roll < 0.15 else 'game',
+            'genres': [{'id': '70'}] if rand.random() < 0.1 else [{'id': '1'}],
+            'platforms': {
+                'windows': True,
+                'mac': rand.random() < 0.3,
+                'linux': rand.random() < 0.2,
+            },
+        }
+        return {str(appid): {'success': True, 'data': data}}
+
+    def news(self, appid, count):
+        now = int(time.time())
+        items = [{
+            'gid': str(appid * 1000 + i),
+            'title': 'News item {} for {}'.format(i, appid),
+            'url': 'http://store.steampowered.com/news/{}'.format(i),
+            'author': 'fakesteam',
+            'contents': '[b]Patch notes[/b]\n' + 'lorem ipsum ' * 200,
+            'date': now - i * ONE_HOUR,
+        } for i in range(count)]
+        return {'appnews': {'appid': appid, 'newsitems': items}}
+
+    def handle(self, path, query):
+        if path.rstrip('/') == '/ISteamApps/GetAppList/v0002':
+            return 200, self.app_list()
+        if path.rstrip('/') == '/api/appdetails':
+            return 200, self.app_details(int(query['appids'][0]))
+        if path.rstrip('/') == '/ISteamNews/GetNewsForApp/v0002':
+            count = int(query.get('count', ['3'])[0])
+            return 200, self.news(int(query['appid'][0]), count)
+        return 404, {}
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        click.echo("served {} requests in {:.1f}s ({:.1f} requests/sec), {} throttled".format(
+            self.served, elapsed, self.served / elapsed if elapsed else 0, self.throttled))
+
+
+def make_handler(steam):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, so pooled clients actually get to reuse connections.
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if steam.latency:
+                time.sleep(steam.latency)
+
+            retry_after = steam.over_quota()
+            if retry_after is not None:
+                status, payload = 429, {}
+            else:
+                status, payload = steam.handle(url.path, parse_qs(url.query))
+            with steam.lock:
+                steam.served += 1
+
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header('Retry-After', str(retry_after))
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8099, show_default=True)
+@click.option('--apps', default=20000, show_default=True,
+              help='Number of apps in the fake catalog.')
+@click.option('--latency', default=0.0, show_default=True,
+              help='Seconds to sleep before answering each request.')
+@click.option('--rate', default=0.0, show_default=True,
+              help='Requests per second to allow before answering 429 (0 for no limit).')
+@click.option('--seed', default=1, show_default=True)
+def fakesteam(host, port, apps, latency, rate, seed):
+    steam = FakeSteam(apps, latency, seed, rate)
+    server = ThreadingHTTPServer((host, port), make_handler(steam))
+    server.daemon_threads = True
+    click.echo("fake steam listening on http://{}:{}/".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        steam.report()
+
+
+if __name__ == '__main__':
+    fakesteam()
@@ -1,18 +1,63 @@
 import os
+import array
+import atexit
+import asyncio
+import bisect
 import datetime
 import json
+import sqlite3
+import hashlib
+import random
 import re
 import time
 import logging
+import signal
+import statistics
+import tempfile
+import threading
+import queue
+import collections
+import concurrent.futures
+import email.utils
+import fcntl
+import urllib.parse
+import zlib
 
 import click
 
 
-USELESS = re.compile(r'(.*(\?\?\?|ValveTestApp|Game Key| E3 |DLC|Dedicated [Ss]erver|_|Soundtrack|Pre\-[Oo]rder|Teaser|[tT]railer|Bleach|Naruto Shippuden Uncut|Fantasy Grounds - |Rocksmith.? (2014 (Edition )?)?. |Inside The Walking Dead|Trailer \d|Add\-On|CD Key).*|(.*(Gameplay|Preview|Review|Pack|Strategy Guide|Development Kit|Trailer|Skin|Foil Conversion|Foil|Deck Key|Demo|OST)$))').match
+USELESS_RE = re.compile(r'(.*(\?\?\?|ValveTestApp|Game Key| E3 |DLC|Dedicated [Ss]erver|_|Soundtrack|Pre\-[Oo]rder|Teaser|[tT]railer|Bleach|Naruto Shippuden Uncut|Fantasy Grounds - |Rocksmith.? (2014 (Edition )?)?. |Inside The Walking Dead|Trailer \d|Add\-On|CD Key).*|(.*(Gameplay|Preview|Review|Pack|Strategy Guide|Development Kit|Trailer|Skin|Foil Conversion|Foil|Deck Key|Demo|OST)$))')
+USELESS = USELESS_RE.match
 
 
 log = logging.getLogger('steamnews')
 
+# overridable so everything can be pointed at fakesteam.py for offline runs.
+API_BASE = os.environ.get('STEAMNEWS_API_BASE', 'http://api.steampowered.com')
+STORE_BASE = os.environ.get('STEAMNEWS_STORE_BASE', 'http://store.steampowered.com')
+
+ONE_DAY = 60 * 60 * 24
+
+# atomfeed.xml shows this many entries, and polls ask steam for this many
+# at a time once a game has some history in the archive.
+FEED_SIZE = 10
+NEWS_PAGE = 3
+
+# feed demand is a hit count that halves every DEMAND_HALF_LIFE, and a feed
+# is hot while that's at least HOT_SCORE.
+DEMAND_HALF_LIFE = 7 * ONE_DAY
+HOT_SCORE = 1.0
+
+# bounds on how often a read feed gets refreshed, whatever its cadence says.
+MIN_REFRESH = 30 * 60
+MAX_REFRESH = ONE_DAY
+
+# the biggest appid sqlite can store.
+MAX_APPID = 2 ** 63 - 1
+
+# shortest Cache-Control max-age handed out, even for overdue feeds.
+MIN_MAX_AGE = 60
+
 
 @click.group()
 @click.option('--debug', is_flag=True, default=False)
@@ -22,7 +67,7 @@ def steamnews(debug):
         level=logging.DEBUG if debug else logging.INFO,
         format='[%(asctime)s] %(levelname)s %(message)s'
     )
-    for d in ['news', 'games', 'templates']:
+    for d in ['news', 'games', 'templates', 'cache']:
         try:
             os.mkdir(d)
         except FileExistsError:
@@ -30,53 +75,142 @@ def steamnews(debug):
 
 
 @steamnews.command()
-def serve():
+@click.option('--generate-workers', default=4, show_default=True,
+              help='Number of feeds for new games to generate at once.')
+@click.option('--generate-queue', default=1000, show_default=True,
+              help='Most feeds to have waiting for generation before turning requests away.')
+def serve(generate_workers, generate_queue):
     import gevent
     import gevent.monkey
     import gevent.wsgi
     gevent.monkey.patch_all()
 
     import flask
+    game_store.migrate_if_empty()
     app = flask.Flask('steamnews')
 
+    counter = AccessCounter()
+    atexit.register(counter.flush)
+
+    # compile the template up front rather than on the first cache miss.
+    get_renderer()
+
     @app.route('/')
     def index():
         return flask.render_template('index.html')
 
 
+    feeds = FeedCache()
+    threadpool = gevent.get_hub().threadpool
+    threadpool.maxsize = max(threadpool.maxsize, generate_workers)
+    generator = FeedGenerator(SingleFlight(), generate_workers, generate_queue, offload=threadpool.apply)
+
     @app.route('/<int:appid>.atom')
     def atom(appid):
+        # flask's int converter takes any size, sqlite doesn't.
+        if appid > MAX_APPID:
+            flask.abort(404)
+
         try:
-            with open('news/{}.atom'.format(appid)) as f:
-                return flask.Response(f.read(), mimetype='application/rss+xml')
+            feed = feeds.head(appid)
         except FileNotFoundError:
-            renderer = AtomRenderer()
-            update_game_news(appid, renderer, mode='x')
-            return atom(appid)
+            # only games the crawl knows about can have a feed, and asking
+            # steam about anything else would just burn quota.
+            if game_store.get(appid) is None:
+                flask.abort(404)
+
+            # only real games count towards demand, so a scanner can't fill
+            # up the access table.
+            counter.hit(appid)
+
+            # nobody waits on steam. the real feed should be there by the
+            # reader's next poll, until then they get an empty one.
+            if not generator.submit(appid):
+                return flask.Response(status=503, headers={'Retry-After': str(generator.retry_after())})
+            return flask.Response(placeholder_feed(appid), status=202, mimetype='application/rss+xml',
+                                  headers={'Retry-After': str(generator.retry_after()),
+                                           'Cache-Control': 'no-store'})
+
+        counter.hit(appid)
+
+        # readers that already have this version don't need the body, or for
+        # us to read it.
+        request = flask.request
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        if not_modified(feed, request.headers.get('If-None-Match'),
+                        request.headers.get('If-Modified-Since')):
+            encoding = pick_encoding(accept_encoding, feed.encodings)
+            return flask.Response(status=304, headers=feed_headers(feed, encoding))
+
+        # precompressed by update, sent exactly as they are on disk.
+        if feed.body is None:
+            feed = feeds.get(appid)
+        encoding = pick_encoding(accept_encoding, feed.encodings)
+        return flask.Response(feed.encoded[encoding], mimetype='application/rss+xml',
+                              headers=feed_headers(feed, encoding))
+
+    @app.route('/stats.json')
+    def stats():
+        return flask.jsonify(feeds=feeds.stats(), generation=generator.stats())
 
     http_server = gevent.wsgi.WSGIServer(('127.0.0.1', 5000), app)
+
+    def on_sigterm():
+        # systemd stops us with SIGTERM, which doesn't run atexit handlers.
+        # finish what's in flight, then save the hits counted since the last
+        # flush.
+        log.info("SIGTERM received, flushing hit counts and stopping")
+        http_server.stop()
+        counter.flush()
+
+    # gevent.signal_handler on newer gevents, gevent.signal on older ones.
+    signal_handler = getattr(gevent, 'signal_handler', None) or gevent.signal
+    signal_handler(signal.SIGTERM, on_sigterm)
     http_server.serve_forever()
 
 
 @steamnews.command()
 def ignored():
-    import requests
+    ignore_list = IgnoreStore()
+    app_map = {appid: name for appid, name in AppListCache().apps() if appid in ignore_list}
 
-    with open('permanently-ignored.json') as f:
-        ignore_list = json.load(f)
+    for ignored in ignore_list:
+        reason, when = ignore_list.entries[ignored]
+        click.echo("{} {} ({}{})".format(
+            ignored, app_map.get(ignored, '<not in catalog>'), reason or 'unknown reason',
+            ', ' + datetime.datetime.fromtimestamp(when).date().isoformat() if when else ''))
 
-    r = requests.get(
-        'http://api.steampowered.com/ISteamApps/GetAppList/v0002/')
-    app_list = r.json()
-    app_list = app_list['applist']['apps']
-    app_map = {int(app['appid']): app['name'] for app in app_list}
 
-    for ignored in sorted(ignore_list):
-        click.echo("{} {}".format(ignored, app_map[ignored]))
+@steamnews.command()
+def migrate():
+    # one-shot import of the old games/*.json files into games.db.
+    count = game_store.migrate('games')
+    click.echo("Imported {} games into {}".format(count, game_store.path))
 
 
 @steamnews.command()
-def update():
+@click.option('--concurrency', default=1, show_default=True,
+              help='Maximum number of appdetails lookups to run at once.')
+@click.option('--rate', default=0.0, show_default=True,
+              help='Requests per second allowed per Steam host (0 for no cap).')
+@click.option('--max-backoff', default=300, show_default=True,
+              help='Give up on the crawl if Steam asks us to wait longer than this.')
+@click.option('--news-workers', default=8, show_default=True,
+              help='Number of threads fetching news at once.')
+@click.option('--render-processes', default=None, type=int,
+              help='Number of processes rendering feeds (defaults to one per CPU).')
+@click.option('--recheck-ignored-after', default=0, show_default=True,
+              help='Look up ignored apps again after this many days (0 for never).')
+@click.option('--max-feeds', default=0, show_default=True,
+              help='Refresh at most this many feeds per run, most requested first (0 for all).')
+@click.option('--cold-interval', default=7, show_default=True,
+              help='Days between refreshes of feeds nobody has been reading.')
+@click.option('--min-interval', default=MIN_REFRESH // 60, show_default=True,
+              help='Minutes to wait at least between refreshes of a feed.')
+@click.option('--max-interval', default=MAX_REFRESH // 60, show_default=True,
+              help='Minutes to wait at most between refreshes of a read feed.')
+def update(concurrency, rate, max_backoff, news_workers, render_processes, recheck_ignored_after,
+           max_feeds, cold_interval, min_interval, max_interval):
     # basic steps:
     # - download list of all apps, filter out the obvious garbage
     # - download list of info for apps we don't know about, or if app
@@ -84,149 +218,2228 @@ def update():
     # - save to index.html
     # - for all games people want to know about, update the news
 
-    update_front_page()
+    game_store.migrate_if_empty()
+
+    # sized for both halves up front: the pools are built on first use, which
+    # is the app list fetch, and don't grow afterwards.
+    steam.connections = max(steam.connections, concurrency, news_workers)
+    limiter = RateLimiter(rate, concurrency, max_backoff)
+    update_front_page(limiter, recheck_ignored_after * ONE_DAY)
+    click.echo(limiter.report())
 
     # looks weird, but we're trying to iterate over all things people want news
-    # for, and then download the news for it according to the json in games/.
-    renderer = AtomRenderer()
+    # for, and then download the news for it according to the game store.
+    appids = [
+        int(os.path.splitext(atom)[0])
+        for atom in os.listdir('news') if atom.endswith('.atom')]
+    appids = drop_orphaned_feeds(appids)
+    appids = schedule_refresh(appids, max_feeds, cold_interval * ONE_DAY)
+    refresh_news(appids, news_workers, render_processes, min_interval * 60, max_interval * 60)
 
-    for atom in os.listdir('news'):
-        appid = os.path.splitext(atom)[0]
-        update_game_news(appid, renderer, mode='w')
+    for line in steam.report():
+        log.info(line)
+        click.echo(line)
 
 
 def update_game_news(appid, renderer, mode):
-    import requests
+    game_info = fetch_game_news(appid)
+    tmp, etag = render_to_temp(appid, game_info, renderer)
+    write_feed(appid, tmp, etag, mode)
+    game_store.put_feed(appid, *feed_signature(game_info))
+    mark_refreshed(appid, game_info['newsitems'])
+
+
+def generate_feed(appid, renderer):
+    # serve's way in, for a feed asked for before update made it. whoever had
+    # the appid before us may well have just written it.
+    if os.path.exists('news/{}.atom'.format(appid)):
+        return
+    try:
+        update_game_news(appid, renderer, mode='x')
+    except FileExistsError:
+        # update got there in the meantime, which is just as good.
+        pass
+
+
+def placeholder_feed(appid):
+    # a real (if empty) feed from the real template, so readers are happy
+    # with it while the actual one is generated.
+    name = game_store.get(appid)['name']
+    return get_renderer()({'appid': appid, 'name': name, 'updated': int(time.time()), 'newsitems': []})
 
-    with open('games/{}.json'.format(appid)) as f:
-        game_info = json.load(f)
 
-    url = 'http://api.steampowered.com/ISteamNews/GetNewsForApp/v0002/?appid={appid}&count=3&format=json'.format(appid=appid)
-    resp = requests.get(url)
-    news = resp.json()
+def fetch_game_news(appid):
+    return load_game_news(appid, fetch_new_newsitems(appid))
 
-    newsitems = news.get('appnews', {}).get('newsitems', [])
+
+def load_game_news(appid, new_newsitems):
+    game_info = game_store.get(appid)
+    if game_info is None:
+        raise LookupError('{} is not a known game'.format(appid))
+
+    game_store.put_news(appid, new_newsitems)
+    newsitems = game_store.news(appid, FEED_SIZE)
     game_info['newsitems'] = newsitems
 
-    with open('news/{}.atom'.format(appid), mode) as f:
-        f.write(renderer(game_info))
+    # the feed is as new as its newest entry, not as new as our last lookup,
+    # so an unchanged feed renders to the same bytes every time. a feed with
+    # no entries keeps whatever it was first written with, since the lookup
+    # time moves every day.
+    if newsitems:
+        game_info['updated'] = max(n['date'] for n in newsitems)
+    else:
+        previous = game_store.feed(appid)
+        game_info['updated'] = previous['updated'] if previous is not None else game_info['lookup_time']
+    return game_info
+
+
+def fetch_new_newsitems(appid):
+    # steam can't give us "everything since X", so ask for a small page and
+    # only keep walking back (with enddate) while every item on the page is
+    # one we haven't archived yet. a quiet game costs one small request, a
+    # busy one still can't lose entries between runs.
+    if game_store.get(appid) is None:
+        # before asking steam, not after.
+        raise LookupError('{} is not a known game'.format(appid))
+
+    latest = game_store.latest_news(appid)
+    count = NEWS_PAGE if latest is not None else FEED_SIZE
+
+    fetched = {}
+    enddate = None
+    while len(fetched) < FEED_SIZE:
+        url = '{base}/ISteamNews/GetNewsForApp/v0002/?appid={appid}&count={count}&format=json'.format(
+            base=API_BASE, appid=appid, count=count)
+        if enddate is not None:
+            url += '&enddate={}'.format(enddate)
+
+        resp = steam.get(url)
+        resp.raise_for_status()
+        newsitems = resp.json().get('appnews', {}).get('newsitems', [])
+
+        new = [n for n in newsitems if latest is None or n['date'] > latest]
+        fetched.update((n['gid'], n) for n in new)
+        if latest is None or len(new) < len(newsitems) or len(newsitems) < count:
+            break
+
+        oldest = min(n['date'] for n in newsitems)
+        if oldest == enddate:
+            break
+        enddate = oldest
+
+    return list(fetched.values())
+
+
+def feed_signature(game_info):
+    # everything that ends up in the rendered feed, plus the template itself,
+    # so a template edit still forces a re-render.
+    newsitems = game_info['newsitems'][:FEED_SIZE]
+    gids = json.dumps([n['gid'] for n in newsitems])
+    digest = hashlib.sha256()
+    digest.update(template_digest().encode('utf-8'))
+    digest.update(str(ARTICLE_VERSION).encode('utf-8'))
+    digest.update(json.dumps(
+        [game_info['appid'], game_info['name'], game_info['updated'], newsitems],
+        sort_keys=True).encode('utf-8'))
+    return gids, digest.hexdigest(), game_info['updated']
+
+
+def feed_unchanged(appid, game_info):
+    previous = game_store.feed(appid)
+    path = 'news/{}.atom'.format(appid)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if previous is None:
+        return False
 
+    # feeds from before there were compressed copies (or before brotli was
+    # installed) get rewritten once to pick them up.
+    if len(compressed_copies(path, st)) != len(feed_encodings()):
+        return False
 
-def update_front_page():
-    import requests
+    gids, digest, _ = feed_signature(game_info)
+    return previous['gids'] == gids and previous['digest'] == digest
 
-    r = requests.get(
-        'http://api.steampowered.com/ISteamApps/GetAppList/v0002/')
-    app_list = r.json()
-    app_list = app_list['applist']['apps']
-    app_list = [g for g in app_list if not USELESS(g['name'])]
 
+_template_digest = None
+
+
+def template_digest():
+    global _template_digest
+    if _template_digest is None:
+        with open('atomfeed.xml', 'rb') as f:
+            _template_digest = hashlib.sha256(f.read()).hexdigest()
+    return _template_digest
+
+
+def render_to_temp(appid, game_info, renderer):
+    # returns the temp file and the feed's ETag, hashed on the way through.
+    # the feed goes to disk a template chunk at a time, so memory is bounded
+    # by the biggest single article rather than the whole feed. temp files
+    # start with a dot and don't end in .atom, so nothing mistakes them for
+    # a feed.
+    fd, tmp = tempfile.mkstemp(dir='news', prefix='.{}.'.format(appid), suffix='.tmp')
+    try:
+        # mkstemp makes it private, feeds used to be (and should be) readable.
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            etag = renderer.stream(game_info, f)
+            f.flush()
+            os.fsync(f.fileno())
+        compress_feed(tmp)
+    except BaseException:
+        discard_temp(tmp)
+        raise
+    return tmp, etag
+
+
+def gzip_encoder():
+    # wbits 31 is a gzip wrapper with no name or mtime in it, so the same
+    # feed always compresses to the same bytes.
+    c = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+def brotli_encoder():
+    import brotli
+    c = brotli.Compressor(quality=11)
+    return c.process, c.finish
+
+
+def feed_encodings():
+    # (content coding, suffix, encoder) for the precompressed copies written
+    # next to every feed, in the order serve prefers them. brotli is optional.
     try:
-        with open('permanently-ignored.json') as f:
-            ignore_list = json.load(f)
-    except Exception:
-        ignore_list = []
+        import brotli
+    except ImportError:
+        return [('gzip', '.gz', gzip_encoder)]
+    return [('br', '.br', brotli_encoder), ('gzip', '.gz', gzip_encoder)]
+
+
+def compress_feed(tmp):
+    # done once here rather than on every request. each copy is stamped with
+    # the feed's own mtime, which is how serve tells it from a copy left
+    # behind by an older version of the feed.
+    st = os.stat(tmp)
+    for coding, suffix, encoder in feed_encodings():
+        compress, finish = encoder()
+        with open(tmp, 'rb') as src, open(tmp + suffix, 'xb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(compress(chunk))
+            dst.write(finish())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.utime(tmp + suffix, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def compressed_copies(path, st):
+    # the encodings with a copy that belongs to this version of the feed.
+    encodings = []
+    for coding, suffix, encoder in feed_encodings():
+        try:
+            if os.stat(path + suffix).st_mtime_ns == st.st_mtime_ns:
+                encodings.append(coding)
+        except FileNotFoundError:
+            pass
+    return encodings
+
+
+def discard_temp(tmp):
+    for path in [tmp] + [tmp + suffix for coding, suffix, encoder in feed_encodings()]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def write_feed(appid, tmp, etag, mode):
+    # readers only ever see a complete feed. 'x' keeps its old meaning of
+    # "only if there isn't one already", via link() which fails if it exists.
+    path = 'news/{}.atom'.format(appid)
+    if mode == 'x' and os.path.exists(path):
+        # checked up front too, so losing the race doesn't clobber the
+        # winner's compressed copies.
+        discard_temp(tmp)
+        raise FileExistsError(path)
+
+    # the copies go first, so whenever serve sees the new feed its copies are
+    # already there. until the feed follows, serve sees they don't match the
+    # old one and sends that uncompressed.
+    for coding, suffix, encoder in feed_encodings():
+        os.replace(tmp + suffix, path + suffix)
+
+    if mode == 'x':
+        try:
+            os.link(tmp, path)
+        finally:
+            os.unlink(tmp)
+    else:
+        os.replace(tmp, path)
+
+    # remembered against the exact file it belongs to, so serve can answer
+    # conditional requests without reading (or hashing) the feed.
+    game_store.put_etag(appid, etag, FeedCache.identity(os.stat(path)))
+
+
+# one renderer per render process, built once when the process starts.
+_renderer = None
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = AtomRenderer(ArticleCache())
+    return _renderer
+
+
+def init_renderer():
+    # forked render processes inherit the parent's renderer, template already
+    # compiled. they only need their own database connection.
+    if _renderer is not None:
+        _renderer.article_cache = ArticleCache()
+    get_renderer()
+
+
+def render_feed(appid, game_info):
+    # the cache counters ride back with the feed, since they live in
+    # whichever process did the rendering.
+    tmp, etag = render_to_temp(appid, game_info, _renderer)
+    return tmp, etag, _renderer.article_cache.take_counts()
+
+
+class Stage:
+    # one step of a Pipeline: a few worker threads pulling from an inbox and
+    # pushing whatever func returns (None means "drop it") to the next stage.
+    def __init__(self, name, func, workers):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.inbox = None
+        self.outbox = None
+
+        self.items = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+        self.running = workers
+
+    def work(self):
+        while True:
+            item = self.inbox.get()
+            if item is Pipeline.DONE:
+                # let our siblings see it too, and the last one out tells
+                # the next stage.
+                self.inbox.put(item)
+                with self.lock:
+                    self.running -= 1
+                    last = self.running == 0
+                if last and self.outbox is not None:
+                    self.outbox.put(item)
+                return
+
+            start = time.monotonic()
+            failed = False
+            try:
+                result = self.func(item)
+            except Exception:
+                # items are appids, or tuples starting with one.
+                appid = item[0] if isinstance(item, tuple) else item
+                log.exception("%s: %s stage failed", appid, self.name)
+                result = None
+                failed = True
+
+            with self.lock:
+                self.busy += time.monotonic() - start
+                self.items += 1
+                if failed:
+                    self.failed += 1
+                elif result is None:
+                    self.dropped += 1
+
+            if not failed and result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+
+class Pipeline:
+    # stages joined by bounded queues, so a slow stage pushes back on the
+    # ones before it instead of everything piling up in memory. queue depths
+    # are sampled while it runs, which together with each stage's busy time
+    # shows where the bottleneck is.
+    DONE = object()
+
+    def __init__(self, stages, depth=32, sample_interval=0.1):
+        self.stages = stages
+        self.sample_interval = sample_interval
+        self.queues = [queue.Queue(maxsize=depth) for _ in stages]
+        for stage, inbox, outbox in zip(stages, self.queues, self.queues[1:] + [None]):
+            stage.inbox = inbox
+            stage.outbox = outbox
+        self.depths = [[] for _ in stages]
+        self.elapsed = 0
+
+    def sample(self, done):
+        while not done.wait(self.sample_interval):
+            for depths, q in zip(self.depths, self.queues):
+                depths.append(q.qsize())
+
+    def run(self, items):
+        start = time.monotonic()
+        done = threading.Event()
+        threads = [threading.Thread(target=self.sample, args=(done,), daemon=True)]
+        for stage in self.stages:
+            threads.extend(threading.Thread(target=stage.work, daemon=True) for _ in range(stage.workers))
+        for t in threads:
+            t.start()
+
+        for item in items:
+            self.queues[0].put(item)
+        self.queues[0].put(self.DONE)
+
+        for t in threads[1:]:
+            t.join()
+        done.set()
+        threads[0].join()
+        self.elapsed = time.monotonic() - start
+
+    def report(self):
+        lines = []
+        for stage, depths in zip(self.stages, self.depths):
+            utilisation = stage.busy / (stage.workers * self.elapsed) if self.elapsed else 0
+            lines.append(
+                "{:<7} {:>2} workers  {:>6} items ({} dropped, {} failed)  {:7.1f}/s  "
+                "{:3.0f}% busy  queue avg {:.1f} max {}".format(
+                    stage.name, stage.workers, stage.items, stage.dropped, stage.failed,
+                    stage.items / self.elapsed if self.elapsed else 0, utilisation * 100,
+                    sum(depths) / len(depths) if depths else 0, max(depths, default=0)))
+        return lines
+
+
+def refresh_news(appids, fetchers=8, renderers=None, floor=None, ceiling=None):
+    # fetch (network, threads) -> parse (archive merge, change detection) ->
+    # render (CPU bound, a process per core) -> write (rename into place).
+    # a broken appid just gets logged, it doesn't take the rest of the run
+    # down with it.
+    renderers = renderers or os.cpu_count() or 1
+    hits = misses = 0
+
+    def fetch(appid):
+        return appid, fetch_new_newsitems(appid)
+
+    def parse(item):
+        appid, new_newsitems = item
+        game_info = load_game_news(appid, new_newsitems)
+        mark_refreshed(appid, game_info['newsitems'], floor, ceiling)
+
+        # leave the file (and its mtime) alone if nothing in it changed.
+        if feed_unchanged(appid, game_info):
+            log.debug("%s: feed unchanged, not rewriting", appid)
+            return None
+        return appid, game_info
+
+    def render(item):
+        appid, game_info = item
+        tmp, etag, counts = render_pool.submit(render_feed, appid, game_info).result()
+        return appid, game_info, tmp, etag, counts
+
+    def write(item):
+        nonlocal hits, misses
+        appid, game_info, tmp, etag, (feed_hits, feed_misses) = item
+        hits += feed_hits
+        misses += feed_misses
+        try:
+            write_feed(appid, tmp, etag, 'w')
+        except BaseException:
+            discard_temp(tmp)
+            raise
+        game_store.put_feed(appid, *feed_signature(game_info))
+        return appid
+
+    # built before the pool forks, so the template is compiled exactly once.
+    get_renderer()
+
+    render_pool = concurrent.futures.ProcessPoolExecutor(renderers, initializer=init_renderer)
+    pipeline = Pipeline([
+        Stage('fetch', fetch, fetchers),
+        Stage('parse', parse, 1),
+        Stage('render', render, renderers),
+        Stage('write', write, 1),
+    ])
+    with render_pool:
+        pipeline.run(appids)
+
+    fetch_stage, parse_stage, render_stage, write_stage = pipeline.stages
+    failed = sum(stage.failed for stage in pipeline.stages)
+    log.info("Refreshed %s feeds in %.1fs, %s unchanged, %s failed",
+             write_stage.items - write_stage.failed, pipeline.elapsed, parse_stage.dropped, failed)
+    log.info("Article cache: %s hits, %s misses (%.0f%% hit rate)",
+             hits, misses, 100 * hits / (hits + misses) if hits + misses else 0)
+    for line in pipeline.report():
+        log.info(line)
+        click.echo(line)
+
+
+def mark_refreshed(appid, newsitems, floor=None, ceiling=None):
+    now = int(time.time())
+    dates = [n['date'] for n in newsitems]
+    game_store.refreshed(appid, now, next_refresh(dates, now, floor, ceiling))
+
+
+def next_refresh(dates, refreshed, floor=None, ceiling=None):
+    # guess when a game will next post from the gaps between its recent
+    # posts, and don't look again before then. a game that's gone quiet for
+    # longer than usual gets looked at less and less often.
+    floor = floor or MIN_REFRESH
+    ceiling = ceiling or MAX_REFRESH
+    dates = sorted(dates, reverse=True)
+    if not dates:
+        # never posted anything, so nothing to expect any time soon.
+        return refreshed + ceiling
+
+    if len(dates) < 2:
+        # no cadence to go on, just how long it's been quiet.
+        expected = refreshed + (refreshed - dates[0]) / 2
+    else:
+        typical = statistics.median(a - b for a, b in zip(dates, dates[1:]))
+        expected = dates[0] + typical
+        if expected <= refreshed:
+            expected = refreshed + (refreshed - dates[0]) / 2
+    return int(min(max(expected, refreshed + floor), refreshed + ceiling))
+
+
+def drop_orphaned_feeds(appids):
+    # games the crawl has since dropped from the store (region blocked,
+    # turned out to be DLC...) can never be refreshed, so their feeds go
+    # rather than failing every run and being served frozen forever.
+    known = {g['appid'] for g in game_store.get_many(appids)}
+    for appid in appids:
+        if appid in known:
+            continue
+        log.info("%s: no longer a known game, removing its feed", appid)
+        path = 'news/{}.atom'.format(appid)
+        for p in [path] + [path + suffix for coding, suffix, encoder in feed_encodings()]:
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+    return [appid for appid in appids if appid in known]
+
+
+def schedule_refresh(appids, limit=0, cold_interval=7 * ONE_DAY):
+    # feeds people are actually reading go first, as soon as their posting
+    # cadence says there might be something new. feeds nobody has asked for
+    # in a while only get a look in every cold_interval, so the news API
+    # quota gets spent where the readers are.
+    now = time.time()
+    demand = game_store.demand(now)
+    refreshed = game_store.last_refreshed()
+
+    hot, cold = [], []
+    for appid in appids:
+        score = demand.get(appid, 0)
+        last, due = refreshed.get(appid, (0, 0))
+        if score >= HOT_SCORE:
+            if due <= now:
+                hot.append((score, appid))
+        elif last < now - cold_interval:
+            cold.append((score, appid))
+
+    hot.sort(reverse=True)
+    cold.sort(reverse=True)
+    scheduled = [appid for _, appid in hot + cold]
+    if limit:
+        scheduled = scheduled[:limit]
+
+    log.info("Refreshing %s of %s feeds (%s hot due, %s cold due, %s not due)",
+             len(scheduled), len(appids), len(hot), len(cold),
+             len(appids) - len(hot) - len(cold))
+    return scheduled
+
+
+def update_front_page(limiter, recheck_after=0):
+    app_list = AppListCache()
+    ignore_list = IgnoreStore()
+
+    if recheck_after:
+        for appid in ignore_list.stale(recheck_after):
+            ignore_list.remove(appid)
 
     def update_apps():
+        asyncio.run(crawl_apps(app_list.filtered, ignore_list, limiter, CrawlState()))
+
+    try:
+        update_apps()
+    finally:
+        game_store.flush()
+        ignore_list.close()
+
+        # a crawl that was cut short (SIGTERM, an error) still changed games,
+        # and the next run won't look at them again for a day, so they go on
+        # the front page now or not at all.
+        log.info("Writing frontend")
+        FrontPage().build(game_store.changed, game_store.removed)
+    log.info("Run complete")
+
+
+def appdetails_url(appid):
+    return '{}/api/appdetails/?appids={}'.format(STORE_BASE, appid)
+
+
+def save_app_details(app, game_info, ignore_list):
+    appid, name = app
+
+    # region blocked, we should ignore it forever
+    success = game_info.get('success', {})
+    if not success:
+        log.info("%s: couldn't successfully get %r, marking as permanently ignored", appid, name)
+        ignore_list.add(appid, 'unavailable')
+        game_store.delete(appid)
+        return
+
+    game_data = game_info.get('data', {})
+    game_type = game_data.get('type', "UNKNOWN!!")
+    if game_type != 'game':
+        ignore_list.add(appid, 'type {}'.format(game_type))
+        game_store.delete(appid)
+        return
+
+    early_access = 70 in set(int(m['id']) for m in game_data.get('genres', []))
+    platforms = game_data.get('platforms', {})
+
+    windows = platforms.get('windows', False)
+    mac = platforms.get('mac', False)
+    linux = platforms.get('linux', False)
+
+    game = {
+        'appid': appid,
+        'name': name,
+        'windows': windows,
+        'mac': mac,
+        'linux': linux,
+        'early_access': early_access,
+        'lookup_time': int(time.time()),
+    }
+
+    game_store.put(game)
+
+
+class SteamResponse:
+    # what SteamClient.aget hands back: the body has already been read, so
+    # the connection is back in the pool by the time anyone looks at it.
+    def __init__(self, status, headers, content):
+        self.status_code = status
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class HTTPError(Exception):
+    pass
+
+
+class EndpointStats:
+    def __init__(self, samples=10000):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latencies = collections.deque(maxlen=samples)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+class SteamClient:
+    # every request to steam goes through here: one keep-alive pool per host
+    # (sync via requests, async via aiohttp), timeouts, retries with jittered
+    # backoff for the transient stuff, and per-endpoint counters.
+    RETRY_STATUSES = {500, 502, 503, 504}
+
+    def __init__(self, connections=10, connect_timeout=5, read_timeout=30,
+                 retries=3, backoff=0.5):
+        self.connections = connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.stats = collections.defaultdict(EndpointStats)
+        self.lock = threading.Lock()
+        self._session = None
+        self._async_session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            import requests.adapters
+
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=self.connections, pool_block=True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def endpoint(self, url):
+        parts = urllib.parse.urlsplit(url)
+        return parts.netloc + parts.path.rstrip('/')
+
+    def record(self, url, elapsed, size=0, error=False, retry=False):
+        with self.lock:
+            stats = self.stats[self.endpoint(url)]
+            stats.requests += 1
+            stats.bytes += size
+            stats.latencies.append(elapsed)
+            if error:
+                stats.errors += 1
+            if retry:
+                stats.retries += 1
+
+    def delay(self, attempt):
+        # "full jitter", so a bunch of workers that failed together don't
+        # all come back at the same moment.
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def get(self, url, **kwargs):
+        import requests
+
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            start = time.monotonic()
+            try:
+                r = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(url, time.monotonic() - start, error=True, retry=not last)
+                if last:
+                    raise
+                log.debug("%s failed (%s), retrying", url, e)
+            else:
+                # streamed bodies haven't been read yet, so trust the header.
+                size = (int(r.headers.get('Content-Length', 0)) if kwargs.get('stream')
+                        else len(r.content))
+                retry = r.status_code in self.RETRY_STATUSES and not last
+                self.record(url, time.monotonic() - start, size,
+                            error=r.status_code >= 400 and r.status_code != 304, retry=retry)
+                if not retry:
+                    return r
+                log.debug("%s returned %s, retrying", url, r.status_code)
+            time.sleep(self.delay(attempt))
+
+    async def aget(self, url, headers=None):
+        import aiohttp
+
+        if self._async_session is None:
+            connector = aiohttp.TCPConnector(limit_per_host=self.connections)
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            self._async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            start = time.monotonic()
+            try:
+                async with self._async_session.get(url, headers=headers) as r:
+                    content = await r.read()
+                    response = SteamResponse(r.status, r.headers, content)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.record(url, time.monotonic() - start, error=True, retry=not last)
+                if last:
+                    raise
+                log.debug("%s failed (%s), retrying", url, e)
+            else:
+                retry = response.status_code in self.RETRY_STATUSES and not last
+                self.record(url, time.monotonic() - start, len(content),
+                            error=response.status_code >= 400, retry=retry)
+                if not retry:
+                    return response
+                log.debug("%s returned %s, retrying", url, response.status_code)
+            await asyncio.sleep(self.delay(attempt))
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+    def report(self):
+        lines = []
+        with self.lock:
+            for endpoint, stats in sorted(self.stats.items()):
+                lines.append(
+                    "{}: {} requests, {} errors, {} retries, {:.1f} KiB, "
+                    "latency p50 {:.0f}ms p90 {:.0f}ms p99 {:.0f}ms".format(
+                        endpoint, stats.requests, stats.errors, stats.retries,
+                        stats.bytes / 1024, stats.percentile(50) * 1000,
+                        stats.percentile(90) * 1000, stats.percentile(99) * 1000))
+        return lines
+
+
+steam = SteamClient()
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS games ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' name TEXT NOT NULL,'
+    ' windows INTEGER NOT NULL,'
+    ' mac INTEGER NOT NULL,'
+    ' linux INTEGER NOT NULL,'
+    ' early_access INTEGER NOT NULL,'
+    ' lookup_time INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS games_lookup_time ON games (lookup_time)',
+
+    # what each feed on disk was last rendered from.
+    'CREATE TABLE IF NOT EXISTS feeds ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' gids TEXT NOT NULL,'
+    ' digest TEXT NOT NULL,'
+    ' updated INTEGER NOT NULL)',
+
+    # every news item we've ever seen, so feeds don't lose entries that
+    # dropped out of steam's latest few between polls.
+    'CREATE TABLE IF NOT EXISTS news ('
+    ' gid TEXT PRIMARY KEY,'
+    ' appid INTEGER NOT NULL,'
+    ' date INTEGER NOT NULL,'
+    ' title TEXT NOT NULL,'
+    ' url TEXT NOT NULL,'
+    ' author TEXT NOT NULL,'
+    ' contents TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS news_appid_date ON news (appid, date)',
+
+    # how much each feed gets read (a decaying hit count, see AccessCounter)
+    # and when we last went and got its news.
+    'CREATE TABLE IF NOT EXISTS access ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' score REAL NOT NULL,'
+    ' last_access INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS schedule ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' refreshed INTEGER NOT NULL)',
+
+    # when a feed is next worth fetching, from its posting cadence.
+    'CREATE TABLE IF NOT EXISTS cadence ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' next_refresh INTEGER NOT NULL)',
+
+    # the ETag of each feed on disk, and which exact file it belongs to.
+    'CREATE TABLE IF NOT EXISTS etags ('
+    ' appid INTEGER PRIMARY KEY,'
+    ' etag TEXT NOT NULL,'
+    ' ino INTEGER NOT NULL,'
+    ' mtime_ns INTEGER NOT NULL,'
+    ' size INTEGER NOT NULL)',
+]
+
+
+class GameStore:
+    # everything we know about each app, in one sqlite file rather than a
+    # json file per app. one connection, shared under a lock, since the
+    # news threads and serve's greenlets all read from it.
+    def __init__(self, path='games.db', batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        self.pending = []
+        self._db = None
+
+        # what this process has touched, for incremental front page builds.
+        self.changed = set()
+        self.removed = set()
+
+    @property
+    def db(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            with db:
+                for statement in SCHEMA:
+                    db.execute(statement)
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def game(row):
+        game = dict(row)
+        for k in ['windows', 'mac', 'linux', 'early_access']:
+            game[k] = bool(game[k])
+        return game
+
+    def get(self, appid):
+        with self.lock:
+            row = self.db.execute('SELECT * FROM games WHERE appid = ?', (int(appid),)).fetchone()
+        return self.game(row) if row is not None else None
+
+    def empty(self):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM games LIMIT 1').fetchone() is None
+
+    def all(self):
+        with self.lock:
+            rows = self.db.execute('SELECT * FROM games ORDER BY appid').fetchall()
+        return [self.game(row) for row in rows]
+
+    def get_many(self, appids):
+        appids = sorted(appids)
+        games = []
+        with self.lock:
+            self.flush()
+            # stay well under sqlite's limit on bound parameters.
+            for i in range(0, len(appids), 500):
+                chunk = appids[i:i + 500]
+                rows = self.db.execute(
+                    'SELECT * FROM games WHERE appid IN ({}) ORDER BY appid'.format(
+                        ','.join('?' * len(chunk))),
+                    chunk)
+                games.extend(self.game(row) for row in rows)
+        return games
+
+    def fresh(self, since):
+        with self.lock:
+            rows = self.db.execute('SELECT appid FROM games WHERE lookup_time > ?', (since,))
+            return {appid for appid, in rows}
+
+    def put(self, game):
+        with self.lock:
+            self.pending.append(game)
+            self.changed.add(game['appid'])
+            self.removed.discard(game['appid'])
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def delete(self, appid):
+        with self.lock:
+            self.flush()
+            with self.db:
+                deleted = self.db.execute('DELETE FROM games WHERE appid = ?', (appid,)).rowcount
+            if deleted:
+                self.changed.discard(appid)
+                self.removed.add(appid)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            with self.db:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO games'
+                    ' (appid, name, windows, mac, linux, early_access, lookup_time)'
+                    ' VALUES (:appid, :name, :windows, :mac, :linux, :early_access, :lookup_time)',
+                    self.pending)
+            self.pending = []
+
+    def feed(self, appid):
+        with self.lock:
+            row = self.db.execute('SELECT * FROM feeds WHERE appid = ?', (int(appid),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def put_feed(self, appid, gids, digest, updated):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO feeds (appid, gids, digest, updated) VALUES (?, ?, ?, ?)',
+                (int(appid), gids, digest, updated))
+
+    def latest_news(self, appid):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT MAX(date) FROM news WHERE appid = ?', (int(appid),)).fetchone()
+        return row[0]
+
+    def news(self, appid, limit):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT gid, date, title, url, author, contents FROM news'
+                ' WHERE appid = ? ORDER BY date DESC, gid DESC LIMIT ?',
+                (int(appid), limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def put_news(self, appid, newsitems):
+        if not newsitems:
+            return
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO news (gid, appid, date, title, url, author, contents)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(str(n['gid']), int(appid), n['date'], n.get('title', ''), n.get('url', ''),
+                  n.get('author', ''), n.get('contents', '')) for n in newsitems])
+
+    def add_hits(self, hits, now):
+        with self.lock, self.db:
+            appids = list(hits)
+            previous = {}
+            for i in range(0, len(appids), 500):
+                chunk = appids[i:i + 500]
+                previous.update(
+                    (appid, (score, last)) for appid, score, last in self.db.execute(
+                        'SELECT appid, score, last_access FROM access WHERE appid IN ({})'.format(
+                            ','.join('?' * len(chunk))),
+                        chunk))
+
+            rows = []
+            for appid, count in hits.items():
+                score, last = previous.get(appid, (0, now))
+                rows.append((appid, decay(score, now - last) + count, int(now)))
+            self.db.executemany(
+                'INSERT OR REPLACE INTO access (appid, score, last_access) VALUES (?, ?, ?)', rows)
+
+    def demand(self, now):
+        with self.lock:
+            rows = self.db.execute('SELECT appid, score, last_access FROM access').fetchall()
+        return {appid: decay(score, now - last) for appid, score, last in rows}
+
+    def refreshed(self, appid, when, next_refresh):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO schedule (appid, refreshed) VALUES (?, ?)',
+                (int(appid), int(when)))
+            self.db.execute(
+                'INSERT OR REPLACE INTO cadence (appid, next_refresh) VALUES (?, ?)',
+                (int(appid), int(next_refresh)))
+
+    def last_refreshed(self):
+        # appid -> (last refresh, next refresh)
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT schedule.appid, schedule.refreshed, cadence.next_refresh'
+                ' FROM schedule LEFT JOIN cadence USING (appid)').fetchall()
+        return {appid: (last, due or 0) for appid, last, due in rows}
+
+    def next_refresh(self, appid):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT next_refresh FROM cadence WHERE appid = ?', (int(appid),)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_etag(self, appid, etag, identity):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO etags (appid, etag, ino, mtime_ns, size) VALUES (?, ?, ?, ?, ?)',
+                (int(appid), etag) + tuple(identity))
+
+    def etag(self, appid):
+        # (etag, identity) or None
+        with self.lock:
+            row = self.db.execute(
+                'SELECT etag, ino, mtime_ns, size FROM etags WHERE appid = ?', (int(appid),)).fetchone()
+        return (row[0], tuple(row[1:])) if row is not None else None
+
+    def migrate(self, directory='games'):
         count = 0
-        for i, app in enumerate(app_list, 1):
-            appid = int(app['appid'])
-            if appid in ignore_list:
+        for p in os.listdir(directory):
+            if not p.endswith('.json'):
                 continue
+            with open(os.path.join(directory, p)) as f:
+                self.put(json.load(f))
+            count += 1
+        self.flush()
+        return count
+
+    def migrate_if_empty(self, directory='games'):
+        # an upgraded install would otherwise start from an empty store: no
+        # front page, no feeds, and the whole catalog crawled again.
+        if not self.empty() or not any(p.endswith('.json') for p in os.listdir(directory)):
+            return
+        log.info("Games database is empty, importing %s", directory)
+        count = self.migrate(directory)
+        log.info("Imported %s games into %s", count, self.path)
+
+
+game_store = GameStore()
+
+
+def decay(score, age):
+    return score * 0.5 ** (max(0, age) / DEMAND_HALF_LIFE)
+
+
+class AccessCounter:
+    # per-feed hit counts from serve. hits are counted in memory and folded
+    # into the store's decaying scores every so often, so a request costs a
+    # dict increment rather than a write.
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.hits = collections.Counter()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+
+    def hit(self, appid):
+        with self.lock:
+            self.hits[appid] += 1
+            due = time.monotonic() - self.flushed >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            hits, self.hits = self.hits, collections.Counter()
+            self.flushed = time.monotonic()
+        if hits:
+            try:
+                game_store.add_hits(hits, time.time())
+            except Exception:
+                # keep them for the next flush rather than losing every
+                # feed's hits along with whatever went wrong.
+                log.exception("Saving hits for %s feeds failed", len(hits))
+                with self.lock:
+                    self.hits.update(hits)
+
+
+class CachedFeed:
+    # encodings lists the precompressed copies there are, encoded holds their
+    # bytes ('identity' being the feed itself). head() leaves body and
+    # encoded as None.
+    def __init__(self, body, identity, checked, etag, mtime, expires, encodings, encoded=None):
+        self.body = body
+        self.identity = identity
+        self.checked = checked
+        self.etag = etag
+        self.mtime = mtime
+        self.expires = expires
+        self.encodings = encodings
+        self.encoded = encoded
+
+    @property
+    def size(self):
+        return sum(len(data) for data in self.encoded.values())
+
+
+class FeedCache:
+    # serve's copy of the feeds on disk, already encoded, least recently used
+    # dropped first. an entry is only checked against the file (inode, mtime,
+    # size) once every `revalidate` seconds, so a hot feed is served with
+    # nothing but the socket write.
+    def __init__(self, max_bytes=64 << 20, revalidate=1.0):
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def identity(st):
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def path(appid):
+        return 'news/{}.atom'.format(appid)
+
+    def cached(self, appid, now):
+        with self.lock:
+            entry = self.entries.get(appid)
+        if entry is None or now - entry.checked < self.revalidate:
+            return entry
 
-            # only check games that are older than 24 hours
+        try:
+            st = os.stat(self.path(appid))
+        except FileNotFoundError:
+            st = None
+        if st is not None and self.identity(st) == entry.identity:
+            entry.checked = now
+            # the next refresh moves every time update looks at the feed.
+            entry.expires = game_store.next_refresh(appid)
+            return entry
+
+        with self.lock:
+            self.invalidations += 1
+            self.drop(appid)
+        return None
+
+    def used(self, appid):
+        # a hit, however it was asked for, keeps the entry off the end of
+        # the LRU.
+        with self.lock:
+            self.hits += 1
+            if appid in self.entries:
+                self.entries.move_to_end(appid)
+
+    def head(self, appid):
+        # enough to answer a conditional request: a cached entry if we have
+        # one, otherwise the validators from the store, as long as they're for
+        # the file that's actually there. only falls back to reading the feed
+        # when neither works out.
+        now = time.monotonic()
+        entry = self.cached(appid, now)
+        if entry is not None:
+            self.used(appid)
+            return entry
+
+        st = os.stat(self.path(appid))
+        stored = game_store.etag(appid)
+        if stored is not None and stored[1] == self.identity(st):
+            return CachedFeed(None, stored[1], now, stored[0], st.st_mtime,
+                              game_store.next_refresh(appid), compressed_copies(self.path(appid), st))
+        return self.get(appid)
+
+    def get(self, appid):
+        now = time.monotonic()
+        entry = self.cached(appid, now)
+        if entry is not None:
+            self.used(appid)
+            return entry
+
+        with open(self.path(appid), 'rb') as f:
+            st = os.fstat(f.fileno())
+            body = f.read()
+
+        encoded = {'identity': body}
+        for coding, suffix, encoder in feed_encodings():
+            try:
+                with open(self.path(appid) + suffix, 'rb') as f:
+                    if os.fstat(f.fileno()).st_mtime_ns == st.st_mtime_ns:
+                        encoded[coding] = f.read()
+            except FileNotFoundError:
+                pass
+
+        identity = self.identity(st)
+        stored = game_store.etag(appid)
+        etag = stored[0] if stored is not None and stored[1] == identity else hashlib.sha1(body).hexdigest()
+        entry = CachedFeed(body, identity, now, etag, st.st_mtime, game_store.next_refresh(appid),
+                           [coding for coding in encoded if coding != 'identity'], encoded)
+
+        with self.lock:
+            self.misses += 1
+            self.drop(appid)
+            self.entries[appid] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                self.drop(next(iter(self.entries)))
+                self.evictions += 1
+        return entry
+
+    def drop(self, appid):
+        entry = self.entries.pop(appid, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+
+def feed_etag(feed, encoding):
+    # each encoding is its own representation, so gets its own tag.
+    if encoding == 'identity':
+        return '"{}"'.format(feed.etag)
+    return '"{}-{}"'.format(feed.etag, encoding)
+
+
+def pick_encoding(accept_encoding, encodings):
+    # the first of the precompressed copies the client will take. q-values
+    # only matter for turning one down (q=0).
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    for coding in encodings:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return 'identity'
+
+
+def feed_headers(feed, encoding):
+    # readers may keep the feed until update is next expected to look at it.
+    max_age = MIN_MAX_AGE
+    if feed.expires is not None:
+        max_age = min(max(int(feed.expires - time.time()), MIN_MAX_AGE), MAX_REFRESH)
+    headers = {
+        'ETag': feed_etag(feed, encoding),
+        'Last-Modified': email.utils.formatdate(feed.mtime, usegmt=True),
+        'Cache-Control': 'public, max-age={}'.format(max_age),
+        'Vary': 'Accept-Encoding',
+    }
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return headers
+
+
+def not_modified(feed, if_none_match, if_modified_since):
+    # If-None-Match wins when both are sent (RFC 7232 section 6).
+    if if_none_match:
+        # all the encodings change together, so any of them being current
+        # means the client's copy is.
+        etags = {feed_etag(feed, coding) for coding in ['identity'] + feed.encodings}
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            # weak comparison, which is all a GET needs.
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == '*' or tag in etags:
+                return True
+        return False
+
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(feed.mtime) <= since
+    return False
+
+
+class SingleFlight:
+    # one call per key at a time across serve processes, by way of a lock on
+    # the key'th byte of a shared file. within a process FeedGenerator's
+    # pending set already makes sure a key is only being generated once, so
+    # there's nothing to coalesce here. the file lock is polled rather than
+    # waited on, since a blocking lockf() would stall every greenlet in the
+    # worker.
+    def __init__(self, path='cache/generate.lock', poll=0.05, max_poll=0.5):
+        self.path = path
+        self.poll = poll
+        self.max_poll = max_poll
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # never closed: closing any descriptor for the file drops every
+        # lockf() lock this process holds on it.
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        self.calls = 0
+        self.lock_waits = 0
+
+    def do(self, key, f):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+        try:
+            self.acquire(key)
+            try:
+                return f()
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, key)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def acquire(self, key):
+        delay = self.poll
+        while True:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, key)
+                return
+            except (BlockingIOError, PermissionError):
+                with self.lock:
+                    self.lock_waits += 1
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_poll)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'lock_waits': self.lock_waits,
+            }
+
+
+class FeedGenerator:
+    # serve's misses, generated in the background so no request waits on
+    # steam. an appid is queued once however often it's asked for, and the
+    # queue is bounded so a flood of made-up appids can't grow it forever.
+    # generation goes through SingleFlight so other serve processes don't
+    # duplicate it.
+    # the generation itself goes to offload(func, args). serve hands it
+    # gevent's threadpool, since rendering, compressing, fsyncing and sqlite
+    # never yield and would otherwise stall every request on the hub.
+    def __init__(self, flights, workers=4, max_queued=1000, samples=1000, offload=None):
+        self.flights = flights
+        self.workers = workers
+        self.offload = offload or (lambda func, args: func(*args))
+        self.queue = queue.Queue(max_queued)
+        self.pending = set()
+        self.lock = threading.Lock()
+
+        # requests/errors/latencies are generations, failures and how long
+        # each took; waits is the time spent queued before that.
+        self.generated = EndpointStats(samples)
+        self.waits = collections.deque(maxlen=samples)
+        self.rejected = 0
+
+        for _ in range(workers):
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, appid):
+        # False if the queue is full and the appid wasn't already on it.
+        with self.lock:
+            if appid in self.pending:
+                return True
+            try:
+                self.queue.put_nowait((appid, time.monotonic()))
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self.pending.add(appid)
+        return True
+
+    def run(self):
+        # a renderer per worker: each one only ever has one generation going,
+        # wherever in the pool it ends up running.
+        renderer = AtomRenderer(ArticleCache())
+        while True:
+            appid, queued = self.queue.get()
+            started = time.monotonic()
+            failed = False
             try:
-                with open('games/{}.json'.format(appid)) as f:
-                    age = json.load(f)['lookup_time']
-            except Exception as e:
-                log.info("%s: no local data available, forced to retrieve", appid)
+                self.flights.do(appid, lambda: self.offload(generate_feed, (appid, renderer)))
+            except Exception:
+                log.exception("%s: generating feed failed", appid)
+                failed = True
+            finally:
+                with self.lock:
+                    self.pending.discard(appid)
+                    self.generated.requests += 1
+                    self.generated.errors += failed
+                    self.generated.latencies.append(time.monotonic() - started)
+                    self.waits.append(started - queued)
+
+    def retry_after(self):
+        # roughly when a feed queued now will be done: the usual generation
+        # time for every round of workers ahead of it.
+        with self.lock:
+            per_feed = self.generated.percentile(50) or 5
+        return max(1, int(per_feed * (self.queue.qsize() // self.workers + 1) + 0.5))
+
+    def stats(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            return {
+                'queued': self.queue.qsize(),
+                'max_queued': self.queue.maxsize,
+                'pending': len(self.pending),
+                'workers': self.workers,
+                'generated': self.generated.requests,
+                'failed': self.generated.errors,
+                'rejected': self.rejected,
+                'latency': {'p{}'.format(p): self.generated.percentile(p) for p in [50, 90, 99]},
+                'wait': {'p{}'.format(p): waits[min(len(waits) - 1, int(len(waits) * p / 100))] if waits else 0
+                         for p in [50, 90, 99]},
+                'single_flight': self.flights.stats(),
+            }
+
+
+class FrontPage:
+    # the front page is every game as one big json array. rather than reading
+    # the whole store back and re-serialising it after every crawl, keep the
+    # serialised games (sorted by appid) alongside a packed array of their
+    # appids, and patch in only what changed this run. everything that scales
+    # with the catalog (loading, splitting, joining) happens in C.
+    def __init__(self, path='cache/frontpage', template='index.html.template',
+                 output='templates/index.html'):
+        self.appids_path = path + '.appids'
+        self.games_path = path + '.jsonl'
+        self.template = template
+        self.output = output
+
+    def build(self, changed, removed):
+        loaded = self.load()
+        if loaded is None:
+            log.info("No materialised front page, building it from scratch")
+            appids, fragments = self.rebuild()
+        elif not changed and not removed and os.path.exists(self.output):
+            log.info("Front page unchanged")
+            return
+        else:
+            appids, fragments = loaded
+            self.apply(appids, fragments, changed, removed)
+            log.info("Front page updated: %s changed, %s removed", len(changed), len(removed))
+
+        self.save(appids, fragments)
+
+        with open(self.template) as f:
+            before, after = f.read().split('INSERT_GAMES_HERE', 1)
+
+        with open(self.output + '.tmp', 'w') as f:
+            # gross, I know.
+            f.write(before)
+            f.write('[')
+            f.write(', '.join(fragments))
+            f.write(']')
+            f.write(after)
+
+        # hack to make it atomic.
+        os.replace(self.output + '.tmp', self.output)
+
+    def load(self):
+        try:
+            with open(self.appids_path, 'rb') as f:
+                appids = array.array('q')
+                appids.frombytes(f.read())
+            with open(self.games_path, encoding='utf-8') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        fragments = data.split('\n') if data else []
+        if len(fragments) != len(appids):
+            # died between writing the two files, start again.
+            log.warning("Materialised front page is inconsistent, rebuilding")
+            return None
+        return appids, fragments
+
+    def rebuild(self):
+        games = game_store.all()
+        return array.array('q', [g['appid'] for g in games]), [json.dumps(g) for g in games]
+
+    def apply(self, appids, fragments, changed, removed):
+        for g in game_store.get_many(changed):
+            i = bisect.bisect_left(appids, g['appid'])
+            if i < len(appids) and appids[i] == g['appid']:
+                fragments[i] = json.dumps(g)
             else:
-                one_day = 60 * 60 * 24
-                if age > time.time() - one_day:
-                    log.info("%s: too young, skipping", appid)
-                    continue
+                appids.insert(i, g['appid'])
+                fragments.insert(i, json.dumps(g))
+
+        for appid in removed:
+            i = bisect.bisect_left(appids, appid)
+            if i < len(appids) and appids[i] == appid:
+                del appids[i]
+                del fragments[i]
+
+    def save(self, appids, fragments):
+        atomic_write(self.games_path, '\n'.join(fragments).encode('utf-8'))
+        atomic_write(self.appids_path, appids.tobytes())
+
+
+class AppListCache:
+    # GetAppList is many MB and barely changes between runs, so keep the last
+    # copy on disk, revalidate it with ETag/Last-Modified, and remember the
+    # filtered list for a given payload so unchanged catalogs skip the regex.
+    # nothing here holds the whole catalog in memory: the payload is streamed
+    # to disk and parsed back one app at a time.
+    def __init__(self, directory='cache'):
+        self.payload_path = os.path.join(directory, 'applist.json')
+        self.filtered_path = os.path.join(directory, 'applist.filtered.jsonl')
+        self.meta_path = os.path.join(directory, 'applist.meta.json')
+        self.refreshed = False
 
-            uri = 'http://store.steampowered.com/api/appdetails/?appids={}'.format(app['appid'])
-            r = requests.get(uri)
-            count += 1
-            if r.status_code == 429:
-                log.info("Exceeded the rate limit after %s requests (%s out of %s)", count, i, len(app_list))
+        try:
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.meta = {}
+
+    def refresh(self):
+        if self.refreshed:
+            return
+        self.refreshed = True
+
+        headers = {}
+        if os.path.exists(self.payload_path):
+            if self.meta.get('etag'):
+                headers['If-None-Match'] = self.meta['etag']
+            if self.meta.get('last_modified'):
+                headers['If-Modified-Since'] = self.meta['last_modified']
+
+        url = '{}/ISteamApps/GetAppList/v0002/'.format(API_BASE)
+        with steam.get(url, headers=headers, stream=True) as r:
+            if r.status_code == 304:
+                log.info("App list not modified, using cached copy")
                 return
+            r.raise_for_status()
+
+            digest = hashlib.sha256()
+            size = 0
+            with open(self.payload_path + '.tmp', 'wb') as f:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+
+        if digest == self.meta.get('sha256') and os.path.exists(self.payload_path):
+            log.info("App list unchanged (%s)", digest[:12])
+            os.remove(self.payload_path + '.tmp')
+        else:
+            log.info("App list changed (%s), cached %s bytes", digest[:12], size)
+            os.replace(self.payload_path + '.tmp', self.payload_path)
+
+        self.meta.update({
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'sha256': digest,
+        })
+        self.save_meta()
+
+    def save_meta(self):
+        atomic_write(self.meta_path, json.dumps(self.meta).encode('utf-8'))
+
+    def apps(self):
+        self.refresh()
+        with open(self.payload_path, encoding='utf-8') as f:
+            yield from iter_apps(f)
+
+    def filtered(self):
+        self.refresh()
+
+        # the filter is part of the key, so editing USELESS invalidates it.
+        key = '{}:{}'.format(
+            self.meta['sha256'],
+            hashlib.sha256(USELESS_RE.pattern.encode('utf-8')).hexdigest())
+        if self.meta.get('filtered') != key or not os.path.exists(self.filtered_path):
+            with open(self.filtered_path + '.tmp', 'w', encoding='utf-8') as f:
+                for appid, name in self.apps():
+                    if not USELESS(name):
+                        f.write(json.dumps([appid, name]) + '\n')
+            os.replace(self.filtered_path + '.tmp', self.filtered_path)
+            self.meta['filtered'] = key
+            self.save_meta()
+
+        with open(self.filtered_path, encoding='utf-8') as f:
+            for line in f:
+                appid, name = json.loads(line)
+                yield appid, name
+
+
+class IgnoreStore:
+    # apps we never want to look up again. permanently-ignored.json is a
+    # compacted snapshot, and everything ignored since then is appended to
+    # permanently-ignored.log as it happens, so nothing is lost if we die
+    # mid-crawl and nothing has to rewrite the whole list to add one app.
+    def __init__(self, path='permanently-ignored.json', log_path='permanently-ignored.log',
+                 compact_after=1000):
+        self.path = path
+        self.log_path = log_path
+        self.compact_after = compact_after
+        self.entries = {}
+        self.logged = 0
+        self.log_file = None
+
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = []
 
-            game_info = r.json()[str(appid)]
+        for entry in snapshot:
+            # plain appids are from before we kept reasons.
+            if isinstance(entry, int):
+                self.entries[entry] = (None, None)
+            else:
+                appid, reason, when = entry
+                self.entries[appid] = (reason, when)
 
-            # region blocked, we should ignore it forever
-            success = game_info.get('success', {})
-            if not success:
-                log.info("%s: couldn't successfully get %r, marking as permanently ignored", appid, app['name'])
-                ignore_list.append(appid)
+        try:
+            with open(log_path) as f:
+                for line in f:
+                    try:
+                        appid, reason, when = json.loads(line)
+                    except ValueError:
+                        # torn write from a crash, everything before it is fine.
+                        log.warning("Skipping corrupt line in %s", log_path)
+                        continue
+                    self.apply(appid, reason, when)
+                    self.logged += 1
+        except FileNotFoundError:
+            pass
+
+    def apply(self, appid, reason, when):
+        # a null reason is a tombstone, written when an app is let back in.
+        if reason is None:
+            self.entries.pop(appid, None)
+        else:
+            self.entries[appid] = (reason, when)
+
+    def __contains__(self, appid):
+        return appid in self.entries
+
+    def __iter__(self):
+        return iter(sorted(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, appid, reason, when):
+        if self.log_file is None:
+            self.log_file = open(self.log_path, 'a')
+        self.log_file.write(json.dumps([appid, reason, when]) + '\n')
+        self.log_file.flush()
+        os.fsync(self.log_file.fileno())
+        self.logged += 1
+
+    def add(self, appid, reason):
+        if appid in self.entries:
+            return
+        when = int(time.time())
+        self.entries[appid] = (reason, when)
+        self.append(appid, reason, when)
+
+    def remove(self, appid):
+        if self.entries.pop(appid, None) is not None:
+            self.append(appid, None, int(time.time()))
+
+    def stale(self, max_age):
+        # entries from before we kept timestamps count as ancient.
+        cutoff = time.time() - max_age
+        return [appid for appid, (_, when) in self.entries.items() if (when or 0) < cutoff]
+
+    def compact(self):
+        snapshot = [[appid, reason, when] for appid, (reason, when) in sorted(self.entries.items())]
+        atomic_write(self.path, json.dumps(snapshot).encode('utf-8'))
+
+        # the snapshot has everything now. if we die before the truncate, the
+        # log just gets replayed over the top of it, which is harmless.
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = open(self.log_path, 'w')
+        self.logged = 0
+
+    def close(self):
+        if self.logged >= self.compact_after:
+            log.info("Compacting ignore list (%s entries)", len(self.entries))
+            self.compact()
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+
+CHUNK_SIZE = 1 << 16
+APPS_START = re.compile(r'"apps"\s*:\s*\[')
+APPS_SEP = re.compile(r'[\s,]*')
+
+
+def iter_apps(f, chunk_size=CHUNK_SIZE):
+    # GetAppList is {"applist": {"apps": [{"appid": .., "name": ..}, ...]}}.
+    # rather than loading all of it, find the start of the array and
+    # raw_decode one app at a time out of a small rolling buffer.
+    decoder = json.JSONDecoder()
+    buf = ''
+    started = False
+
+    while True:
+        chunk = f.read(chunk_size)
+        buf += chunk
+
+        if not started:
+            m = APPS_START.search(buf)
+            if m is None:
+                if not chunk:
+                    return
+                buf = buf[-32:]
                 continue
+            buf = buf[m.end():]
+            started = True
 
-            game_data = game_info.get('data', {})
-            game_type = game_data.get('type', "UNKNOWN!!")
-            if game_type != 'game':
-                ignore_list.append(appid)
+        pos = 0
+        while True:
+            pos = APPS_SEP.match(buf, pos).end()
+            if buf.startswith(']', pos):
+                return
+            try:
+                app, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # half an app at the end of the buffer, go get the rest.
+                break
+            yield int(app['appid']), app['name']
+            pos = end
+
+        buf = buf[pos:]
+        if not chunk:
+            raise ValueError('app list ended before the apps array did')
+
+
+def atomic_write(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_at = 0
+        self.paused_until = 0
+
+    def pause(self, seconds):
+        now = time.monotonic()
+        self.paused_at = now
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
                 continue
 
-            early_access = 70 in set(int(m['id']) for m in game_data.get('genres', []))
-            platforms = game_data.get('platforms', {})
-
-            windows = platforms.get('windows', False)
-            mac = platforms.get('mac', False)
-            linux = platforms.get('linux', False)
-
-            game = {
-                'appid': appid,
-                'name': app['name'],
-                'windows': windows,
-                'mac': mac,
-                'linux': linux,
-                'early_access': early_access,
-                'lookup_time': int(time.time()),
-            }
+            if not self.rate:
+                return
 
-            with open('games/{}.json'.format(appid), 'w') as f:
-                json.dump(game, f)
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    # AIMD: grow the window by one per window's worth of successes, halve it
+    # every time we get throttled.
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.inflight = 0
+        self.cond = None
+
+    async def __aenter__(self):
+        if self.cond is None:
+            self.cond = asyncio.Condition()
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def decrease(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class Throttled(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, rate, concurrency, max_backoff=300):
+        self.rate = rate
+        self.concurrency = AdaptiveConcurrency(concurrency)
+        self.max_backoff = max_backoff
+        self.buckets = {}
+
+        self.requests = 0
+        self.throttle_events = 0
+        self.waited = 0
+        self.paused_until = 0
+        self.backoff = 1
+        self.started = time.monotonic()
+
+    def bucket(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate)
+        return self.buckets[host]
+
+    async def acquire(self, url):
+        await self.bucket(url).acquire()
+        self.requests += 1
+
+    def success(self):
+        self.backoff = 1
+        self.concurrency.increase()
+
+    def throttled(self, url, sent, retry_after=None):
+        # every request in flight when the quota ran out comes back 429. one
+        # overrun means one decrease and one pause, so anything sent before
+        # the current pause began has already been dealt with.
+        bucket = self.bucket(url)
+        if sent < bucket.paused_at:
+            return
+
+        self.throttle_events += 1
+        self.concurrency.decrease()
+
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            # no hint from steam, so back off exponentially until it stops
+            # complaining.
+            delay = self.backoff
+            self.backoff = min(self.backoff * 2, self.max_backoff * 2)
+
+        if delay > self.max_backoff:
+            raise Throttled(delay)
+
+        log.info("Throttled by %s, waiting %.1fs (concurrency now %d)",
+                 urllib.parse.urlsplit(url).netloc, delay, int(self.concurrency.limit))
+        # wall clock time spent paused, not the sum of overlapping delays.
+        now = time.monotonic()
+        self.waited += max(0, now + delay - max(now, self.paused_until))
+        self.paused_until = max(self.paused_until, now + delay)
+        bucket.pause(delay)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        return ("{} requests in {:.1f}s ({:.2f} requests/sec), {} throttle events, "
+                "{:.0f}s spent waiting, final concurrency {}").format(
+            self.requests, elapsed, self.requests / elapsed if elapsed else 0,
+            self.throttle_events, self.waited, int(self.concurrency.limit))
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
 
     try:
-        update_apps()
-    finally:
-        with open('permanently-ignored.json', 'w') as f:
-            json.dump(ignore_list, f)
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, when.timestamp() - time.time())
+
+
+class CrawlState:
+    # where the last crawl got up to, so a run that gets cut short (429,
+    # crash, systemd timeout) doesn't start from the top of the catalog again
+    # and the whole catalog gets covered evenly over a few runs.
+    def __init__(self, path='crawl-state.json', interval=30):
+        self.path = path
+        self.interval = interval
+        self.cursor = None
+        self.pending = []
+        self.inflight = set()
+        self.saved = time.monotonic()
 
-    log.info("Writing frontend")
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            log.warning("Ignoring corrupt crawl state in %s", path)
+            return
+
+        self.cursor = state.get('cursor')
+        self.pending = state.get('pending', [])
+
+    def order(self, open_apps):
+        # anything that was in flight last time goes first, then everything
+        # after the cursor in catalog order, wrapping around to the start.
+        # open_apps is called for each pass rather than keeping the catalog
+        # in memory.
+        pending = set(self.pending)
+        cursor = self.cursor
+
+        if pending:
+            for app in open_apps():
+                if app[0] in pending:
+                    yield app
+
+        if cursor is None or not any(appid == cursor for appid, _ in open_apps()):
+            for app in open_apps():
+                if app[0] not in pending:
+                    yield app
+            return
+
+        after = False
+        for app in open_apps():
+            if after and app[0] not in pending:
+                yield app
+            after = after or app[0] == cursor
+
+        for app in open_apps():
+            if app[0] == cursor:
+                break
+            if app[0] not in pending:
+                yield app
+
+    def dispatch(self, appid):
+        self.inflight.add(appid)
+        if appid in self.pending:
+            self.pending.remove(appid)
+        else:
+            self.cursor = appid
+
+    def finish(self, appid):
+        self.inflight.discard(appid)
+
+    def due(self):
+        return time.monotonic() - self.saved >= self.interval
+
+    def save(self):
+        state = {
+            'cursor': self.cursor,
+            'pending': sorted(set(self.pending) | self.inflight),
+        }
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+        self.saved = time.monotonic()
+
+
+async def crawl_apps(open_apps, ignore_list, limiter, state):
+    # every worker pulls from the same iterator, so each app is only handed
+    # out once. how many of them are actually allowed to have a request in
+    # flight is up to the limiter.
+    apps = enumerate(state.order(open_apps), 1)
+    stop = False
+    interrupted = False
+
+    # only check games that are older than 24 hours
+    fresh = game_store.fresh(time.time() - ONE_DAY)
+    log.info("%s games were looked up in the last day, skipping them", len(fresh))
+
+    def checkpoint():
+        # games first, so the cursor never claims more than is on disk.
+        game_store.flush()
+        state.save()
+
+    def on_sigterm():
+        nonlocal stop, interrupted
+        log.info("SIGTERM received, saving crawl state and stopping")
+        stop = interrupted = True
+        checkpoint()
+
+    async def lookup(app):
+        appid = app[0]
+        url = appdetails_url(appid)
+
+        while True:
+            await limiter.acquire(url)
+            async with limiter.concurrency:
+                sent = time.monotonic()
+                r = await steam.aget(url)
+
+            if r.status_code != 429:
+                if r.status_code >= 400:
+                    raise HTTPError('{} returned {}'.format(url, r.status_code))
+                limiter.success()
+                return r.json()[str(appid)]
+
+            # try the same app again once we're allowed to.
+            limiter.throttled(url, sent, r.headers.get('Retry-After'))
+
+    async def worker():
+        nonlocal stop
+
+        for i, app in apps:
+            if stop:
+                return
 
-    with open('index.html.template') as f:
-        template = f.read()
+            appid = app[0]
+            state.dispatch(appid)
+            if appid in ignore_list or appid in fresh:
+                state.finish(appid)
+                continue
 
-    games = [
-        json.load(open(os.path.join('games', p)))
-        for p in os.listdir('games')]
+            try:
+                game_info = await lookup(app)
+                save_app_details(app, game_info, ignore_list)
+            except Throttled as e:
+                if not stop:
+                    log.info("Steam wants us to back off for %.0fs, stopping after %s apps",
+                             e.args[0], i)
+                stop = True
+                return
+            except Exception:
+                # an error status, a connection that stayed broken through the
+                # retries, a null or mangled body: that app's problem, not the
+                # crawl's. it gets looked at again on the next pass.
+                log.exception("%s: app details lookup failed", appid)
 
-    with open('index.html.tmp', 'w') as f:
-        # gross, I know.
-        f.write(template.replace('INSERT_GAMES_HERE', json.dumps(games)))
+            state.finish(appid)
+            if state.due():
+                checkpoint()
 
-    # hack to make it atomic.
-    os.rename('index.html.tmp', 'templates/index.html')
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
 
-    log.info("Run complete")
+    try:
+        await asyncio.gather(*[worker() for _ in range(limiter.concurrency.maximum)])
+    finally:
+        await steam.aclose()
+        loop.remove_signal_handler(signal.SIGTERM)
+        checkpoint()
+        log.info("Crawl finished: %s", limiter.report())
+
+    if interrupted:
+        raise SystemExit(128 + signal.SIGTERM)
+
+
+# bump whenever render_article's output changes, so cached articles from
+# the old renderer stop matching.
+ARTICLE_VERSION = 3
+
+
+class ArticleCache:
+    # rendered article bodies, keyed by gid, a hash of the contents and the
+    # renderer version, since a gid's contents almost never change but get
+    # re-rendered on every refresh. least recently used articles get evicted
+    # once the cache is over max_bytes.
+    def __init__(self, path='cache/articles.db', max_bytes=256 << 20, evict_every=200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.used = set()
+        self.inserted = 0
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            # every render process has its own connection to this. serve's
+            # generator moves a cache between pool threads, but never uses it
+            # from two at once.
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            with db:
+                db.execute(
+                    'CREATE TABLE IF NOT EXISTS articles ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' html TEXT NOT NULL,'
+                    ' size INTEGER NOT NULL,'
+                    ' used INTEGER NOT NULL)')
+                db.execute('CREATE INDEX IF NOT EXISTS articles_used ON articles (used)')
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def key(gid, contents):
+        digest = hashlib.sha1(contents.encode('utf-8')).hexdigest()
+        return '{}:{}:{}'.format(gid, digest, ARTICLE_VERSION)
+
+    def get(self, key):
+        row = self.db.execute('SELECT html FROM articles WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.add(key)
+        return row[0]
+
+    def put(self, key, html):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO articles (key, html, size, used) VALUES (?, ?, ?, ?)',
+                (key, html, len(html), int(time.time())))
+        self.inserted += 1
+
+    def sync(self):
+        # recency is only written back once per feed, not once per hit.
+        if self.used:
+            with self.db:
+                self.db.executemany(
+                    'UPDATE articles SET used = ? WHERE key = ?',
+                    [(int(time.time()), key) for key in self.used])
+            self.used = set()
+
+        if self.inserted >= self.evict_every:
+            self.evict()
+            self.inserted = 0
+
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM articles').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # go a bit under the limit so we aren't evicting on every sync.
+        excess = total - self.max_bytes * 0.9
+        doomed = []
+        for key, size in self.db.execute('SELECT key, size FROM articles ORDER BY used'):
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+
+        with self.db:
+            self.db.executemany('DELETE FROM articles WHERE key = ?', doomed)
+        log.info("Evicted %s articles from the article cache", len(doomed))
+
+    def take_counts(self):
+        counts = self.hits, self.misses
+        self.hits = self.misses = 0
+        return counts
+
+
+class ArticleClassifier:
+    # works out what an article body is written in with one compiled scan,
+    # rather than a lower() and a substring search per known bbcode tag.
+    # steam serves bbcode, html, plain text and any mix of them.
+    def __init__(self, tags):
+        tags = '|'.join(re.escape(t) for t in sorted(tags, key=len, reverse=True))
+        # the leading character class lets the regex engine skip straight to
+        # the next [, < or &, which is most of the speed.
+        self.scan = re.compile(
+            r'[\[<&](?:'
+            r'(?<=\[)(?P<bbcode>/?(?:{})(?=[\]=\s]))'
+            r'|(?<=<)(?P<html>/?[a-z][a-z0-9]*(?=[\s/>]))'
+            r'|(?<=&)(?P<entity>(?:[a-z]+|#[0-9]+);))'.format(tags),
+            re.IGNORECASE).finditer
+
+    def __call__(self, value):
+        bbcode = html = False
+        for m in self.scan(value):
+            if m.lastgroup == 'bbcode':
+                bbcode = True
+            else:
+                html = True
+            if bbcode and html:
+                return 'mixed'
+        return 'bbcode' if bbcode else 'html' if html else 'plain'
 
 
 class AtomRenderer:
-    def __init__(self):
+    def __init__(self, article_cache=None, template='atomfeed.xml', bytecode_cache='cache/jinja'):
         import bbcode
         import jinja2
 
-        with open('atomfeed.xml') as f:
-            atom_template = f.read()
-
-        env = jinja2.Environment()
-        env.loader = jinja2.DictLoader({'atom': atom_template})
+        # the compiled template is kept on disk between runs, so only the
+        # first process after atomfeed.xml changes pays for compiling it.
+        if bytecode_cache is not None:
+            os.makedirs(bytecode_cache, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache)
+
+        # autoescaping covers the titles, authors and urls in the feed, in
+        # both text and attribute positions.
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(os.path.dirname(os.path.abspath(template))),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+            autoescape=jinja2.select_autoescape(['xml']),
+        )
         env.filters['article'] = self.render_article
         env.filters['isodate'] = self.isodate
 
         self.env = env
+        self.template = env.get_template(os.path.basename(template))
+        self.article_cache = article_cache
 
         self.bbcode_parser = bbcode.Parser(escape_html=False, replace_links=False)
         self.bbcode_parser.add_simple_formatter('img', '<img src="%(value)s">')
@@ -235,24 +2448,58 @@ class AtomRenderer:
             tag = 'h%d' % i
             self.bbcode_parser.add_simple_formatter(tag, '<{t}>%(value)s</{t}>'.format(t=tag))
 
-    def render_article(self, value):
-        import cgi
-        for k in self.bbcode_parser.recognized_tags.keys():
-
-            # don't check closing bracket for [url=...] tags.
-            k = '[%s' % k
-
-            # handle upper case tags
-            if k in value.lower():
-                return cgi.escape(self.bbcode_parser.format(value))
-
-        return cgi.escape(value)  # assumed HTML
+        self.classify = ArticleClassifier(self.bbcode_parser.recognized_tags)
+
+    def render_article(self, value, gid=None):
+        # returns Markup, i.e. already escaped for the feed, so the template's
+        # autoescaping leaves it alone and cache hits skip escaping too.
+        import markupsafe
+
+        if self.article_cache is None or gid is None:
+            return self.format_article(value)
+
+        key = self.article_cache.key(gid, value)
+        html = self.article_cache.get(key)
+        if html is None:
+            html = self.format_article(value)
+            self.article_cache.put(key, str(html))
+        return markupsafe.Markup(html)
+
+    def format_article(self, value):
+        import markupsafe
+
+        kind = self.classify(value)
+        if kind in ('bbcode', 'mixed'):
+            # the parser leaves html alone, so mixed content survives too.
+            html = self.bbcode_parser.format(value)
+        elif kind == 'plain':
+            html = value.replace('\n', '<br />\n')
+        else:
+            html = value
+        # the article is html going into an xml text node, so it gets
+        # escaped exactly once here (markupsafe's C speedups do the work).
+        return markupsafe.escape(html)
 
     def isodate(self, value):
         return datetime.datetime.fromtimestamp(value).isoformat()
 
+    def stream(self, game, f):
+        # f is binary. returns the feed's ETag, a hash of exactly the bytes
+        # written.
+        digest = hashlib.sha1()
+        for chunk in self.template.generate(game):
+            data = chunk.encode('utf-8')
+            digest.update(data)
+            f.write(data)
+        if self.article_cache is not None:
+            self.article_cache.sync()
+        return digest.hexdigest()
+
     def __call__(self, game):
-        return self.env.get_template('atom').render(game)
+        feed = self.template.render(game)
+        if self.article_cache is not None:
+            self.article_cache.sync()
+        return feed
 
 
 if __name__ == '__main__':
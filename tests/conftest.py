@@ -0,0 +1,6 @@
+import os
+import sys
+
+# fetcher.py is a script at the top of the repo rather than a package, so
+# make it importable however pytest was started.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import io
+import json
+import unittest
+
+import fetcher
+
+
+def applist(apps):
+    return json.dumps({'applist': {'apps': [{'appid': a, 'name': n} for a, n in apps]}})
+
+
+class IterAppsTest(unittest.TestCase):
+    def parse(self, text, chunk_size=7):
+        # chunks smaller than an app, so every app straddles a boundary.
+        return list(fetcher.iter_apps(io.StringIO(text), chunk_size))
+
+    def test_streams_every_app(self):
+        apps = [(10, 'Half-Life'), (20, 'Team Fortress Classic'), (30, 'Day of Defeat')]
+        self.assertEqual(self.parse(applist(apps)), apps)
+
+    def test_awkward_names(self):
+        apps = [(1, 'Brackets ] and [ braces }{'), (2, 'Quote " and \\ slash'), (3, '"apps": [')]
+        self.assertEqual(self.parse(applist(apps)), apps)
+
+    def test_whitespace_between_apps(self):
+        text = '{ "applist" : { "apps" :\n[ {"appid": 1, "name": "a"} ,\n\n {"appid": 2, "name": "b"} ] } }'
+        self.assertEqual(self.parse(text), [(1, 'a'), (2, 'b')])
+
+    def test_empty_catalog(self):
+        self.assertEqual(self.parse(applist([])), [])
+
+    def test_no_apps_array(self):
+        self.assertEqual(self.parse('{"applist": {}}'), [])
+
+    def test_truncated_payload(self):
+        text = applist([(1, 'a'), (2, 'b')])[:-20]
+        with self.assertRaises(ValueError):
+            self.parse(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+
+import fetcher
+
+
+CATALOG = [(appid, 'Game {}'.format(appid)) for appid in [10, 20, 30, 40, 50]]
+
+
+def open_apps():
+    return iter(CATALOG)
+
+
+class CrawlStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'crawl-state.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def state(self, **saved):
+        if saved:
+            with open(self.path, 'w') as f:
+                json.dump(saved, f)
+        return fetcher.CrawlState(self.path)
+
+    def order(self, state):
+        return [appid for appid, _ in state.order(open_apps)]
+
+    def test_fresh_crawl_is_catalog_order(self):
+        self.assertEqual(self.order(self.state()), [10, 20, 30, 40, 50])
+
+    def test_resumes_after_cursor_and_wraps(self):
+        self.assertEqual(self.order(self.state(cursor=30)), [40, 50, 10, 20])
+
+    def test_pending_goes_first_and_only_once(self):
+        state = self.state(cursor=30, pending=[20, 50])
+        self.assertEqual(self.order(state), [20, 50, 40, 10])
+
+    def test_cursor_gone_from_catalog_starts_over(self):
+        state = self.state(cursor=35, pending=[40])
+        self.assertEqual(self.order(state), [40, 10, 20, 30, 50])
+
+    def test_corrupt_state_is_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write('{"cursor": ')
+        state = fetcher.CrawlState(self.path)
+        self.assertIsNone(state.cursor)
+        self.assertEqual(state.pending, [])
+
+    def test_save_keeps_inflight_apps_for_next_run(self):
+        state = self.state()
+        apps = state.order(open_apps)
+        for appid, _ in [next(apps), next(apps), next(apps)]:
+            state.dispatch(appid)
+        state.finish(10)
+        state.finish(30)
+        state.save()
+
+        resumed = fetcher.CrawlState(self.path)
+        self.assertEqual(resumed.cursor, 30)
+        self.assertEqual(resumed.pending, [20])
+        self.assertEqual(self.order(resumed), [20, 40, 50, 10])
+
+    def test_dispatching_pending_app_leaves_cursor_alone(self):
+        state = self.state(cursor=30, pending=[20])
+        state.dispatch(20)
+        self.assertEqual(state.cursor, 30)
+        self.assertEqual(state.pending, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
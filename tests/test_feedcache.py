@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import fetcher
+
+
+class FeedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.here = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir('news')
+        self.game_store = fetcher.game_store
+        fetcher.game_store = fetcher.GameStore('games.db')
+
+    def tearDown(self):
+        fetcher.game_store = self.game_store
+        os.chdir(self.here)
+        self.tmp.cleanup()
+
+    def write(self, appid, size):
+        with open('news/{}.atom'.format(appid), 'wb') as f:
+            f.write(b'x' * size)
+
+    def request(self, feeds, appid):
+        # what serve's atom route does for an unconditional request.
+        feed = feeds.head(appid)
+        if feed.body is None:
+            feed = feeds.get(appid)
+        return feed
+
+    def test_repeat_requests_are_hits(self):
+        self.write(10, 100)
+        feeds = fetcher.FeedCache()
+        for _ in range(5):
+            self.assertEqual(self.request(feeds, 10).body, b'x' * 100)
+
+        stats = feeds.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 4)
+
+    def test_least_recently_used_is_evicted(self):
+        for appid in [20, 30, 40]:
+            self.write(appid, 100)
+        feeds = fetcher.FeedCache(max_bytes=250)
+        for appid in [20, 30, 20, 40]:
+            self.request(feeds, appid)
+
+        self.assertEqual(list(feeds.entries), [20, 40])
+        self.assertEqual(feeds.stats()['evictions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+import fetcher
+
+
+class IgnoreStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'permanently-ignored.json')
+        self.log_path = os.path.join(self.tmp.name, 'permanently-ignored.log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def store(self, **kwargs):
+        return fetcher.IgnoreStore(self.path, self.log_path, **kwargs)
+
+    def test_additions_replay_from_the_log(self):
+        store = self.store()
+        store.add(10, 'unavailable')
+        store.add(20, 'type dlc')
+        store.close()
+
+        reloaded = self.store()
+        self.assertEqual(list(reloaded), [10, 20])
+        self.assertEqual(reloaded.entries[20][0], 'type dlc')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_tombstone_lets_an_app_back_in(self):
+        store = self.store()
+        store.add(10, 'unavailable')
+        store.remove(10)
+        store.close()
+
+        self.assertNotIn(10, self.store())
+
+    def test_tombstone_overrides_the_snapshot(self):
+        with open(self.path, 'w') as f:
+            json.dump([[10, 'unavailable', 1], 20], f)
+        store = self.store()
+        store.remove(10)
+        store.close()
+
+        reloaded = self.store()
+        self.assertEqual(list(reloaded), [20])
+        # plain appids are from before reasons were kept.
+        self.assertEqual(reloaded.entries[20], (None, None))
+
+    def test_torn_line_is_skipped(self):
+        store = self.store()
+        store.add(10, 'unavailable')
+        store.close()
+        with open(self.log_path, 'a') as f:
+            f.write('[20, "type d')
+
+        self.assertEqual(list(self.store()), [10])
+
+    def test_compaction_folds_the_log_into_the_snapshot(self):
+        store = self.store(compact_after=2)
+        store.add(10, 'unavailable')
+        store.add(20, 'type dlc')
+        store.remove(10)
+        store.close()
+
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+        with open(self.path) as f:
+            self.assertEqual([appid for appid, _, _ in json.load(f)], [20])
+        self.assertEqual(list(self.store()), [20])
+
+
+if __name__ == '__main__':
+    unittest.main()
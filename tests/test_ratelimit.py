@@ -0,0 +1,60 @@
+import time
+import unittest
+
+import fetcher
+
+
+URL = 'http://store.example/api/appdetails/?appids=10'
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_one_overrun_backs_off_once(self):
+        # everything in flight when the quota runs out comes back 429.
+        limiter = fetcher.RateLimiter(20, 16)
+        sent = time.monotonic()
+        for _ in range(16):
+            limiter.throttled(URL, sent, '2')
+
+        self.assertEqual(limiter.throttle_events, 1)
+        self.assertEqual(int(limiter.concurrency.limit), 8)
+        self.assertAlmostEqual(limiter.waited, 2)
+
+    def test_requests_sent_after_the_pause_count_again(self):
+        limiter = fetcher.RateLimiter(20, 16)
+        limiter.throttled(URL, time.monotonic(), '2')
+        limiter.throttled(URL, time.monotonic(), '2')
+
+        self.assertEqual(limiter.throttle_events, 2)
+        self.assertEqual(int(limiter.concurrency.limit), 4)
+        # the second pause mostly overlaps the first.
+        self.assertLess(limiter.waited, 2.5)
+
+    def test_long_pause_gives_up(self):
+        limiter = fetcher.RateLimiter(20, 16, max_backoff=60)
+        with self.assertRaises(fetcher.Throttled):
+            limiter.throttled(URL, time.monotonic(), '600')
+
+
+class NextRefreshTest(unittest.TestCase):
+    NOW = 1500000000
+
+    def test_no_posts_waits_the_ceiling(self):
+        self.assertEqual(fetcher.next_refresh([], self.NOW), self.NOW + fetcher.MAX_REFRESH)
+
+    def test_single_post_backs_off_with_silence(self):
+        # quiet for 12 hours, so look again in 6.
+        posted = self.NOW - 12 * 60 * 60
+        self.assertEqual(fetcher.next_refresh([posted], self.NOW), self.NOW + 6 * 60 * 60)
+
+    def test_single_recent_post_is_clamped_to_the_floor(self):
+        posted = self.NOW - 60
+        self.assertEqual(fetcher.next_refresh([posted], self.NOW), self.NOW + fetcher.MIN_REFRESH)
+
+    def test_cadence_from_posting_gaps(self):
+        hour = 60 * 60
+        dates = [self.NOW - hour, self.NOW - 5 * hour, self.NOW - 9 * hour]
+        self.assertEqual(fetcher.next_refresh(dates, self.NOW), self.NOW + 3 * hour)
+
+
+if __name__ == '__main__':
+    unittest.main()